@@ -0,0 +1,59 @@
+"""Apply pending database migrations ahead of a deploy.
+
+    python migrate.py           # run pending migrations
+    python migrate.py --check   # exit 1 if the schema is behind
+    python migrate.py --backfill-fingerprints   # re-fingerprint leads missing them
+    python migrate.py --rebuild-stats           # recompute the lead_stats rollup
+"""
+import argparse
+import asyncio
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+
+
+async def main(check: bool, backfill_fingerprints: bool, rebuild_stats: bool) -> int:
+    if not server.MONGO_URL:
+        print("Configure MONGO_URL no ambiente", file=sys.stderr)
+        return 2
+
+    client = AsyncIOMotorClient(server.MONGO_URL)
+    db = client[server.MONGO_DB_NAME]
+    try:
+        current = await server.get_schema_version(db)
+        print(f"Schema version: {current} (latest: {server.SCHEMA_VERSION})")
+        if check:
+            return 0 if current >= server.SCHEMA_VERSION else 1
+        if backfill_fingerprints:
+            updated = await server.backfill_lead_fingerprints(db)
+            print(f"Fingerprinted {updated} leads")
+            return 0
+        if rebuild_stats:
+            buckets = await server.rebuild_lead_stats(db)
+            print(f"Rebuilt {buckets} lead stats buckets")
+            return 0
+        try:
+            applied = await server.run_migrations(db)
+        except server.MigrationLeaseLost as exc:
+            print(exc, file=sys.stderr)
+            return 1
+        for name in applied:
+            print(f"Applied {name}")
+        if not applied:
+            print("Nothing to apply")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only report whether migrations are pending")
+    parser.add_argument(
+        "--backfill-fingerprints", action="store_true", help="fingerprint leads imported without phone/email fingerprints"
+    )
+    parser.add_argument("--rebuild-stats", action="store_true", help="recompute lead statistics from the leads collection")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.check, args.backfill_fingerprints, args.rebuild_stats)))
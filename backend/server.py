@@ -1,22 +1,49 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, status, UploadFile, File, Form
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
-import logging
+import asyncio
+from abc import ABC, abstractmethod
 import base64
+import logging
+import gzip
+import hashlib
+import hmac
+import random
+import re
+import smtplib
 from pathlib import Path
+from urllib.parse import quote
+from email.message import EmailMessage
+import httpx
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import AsyncIterator, Awaitable, Callable, List, NamedTuple, Optional, Tuple
 import uuid
 from datetime import datetime, timezone, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+import csv
 import json
-from collections import defaultdict
+import tempfile
+import zlib
+import gridfs.errors
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import time
-from pymongo import ASCENDING, DESCENDING
+import threading
+from contextlib import asynccontextmanager
+from pymongo import ASCENDING, DESCENDING, TEXT, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from pymongo.errors import BulkWriteError, ConfigurationError, DuplicateKeyError, OperationFailure, PyMongoError, WriteError
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -25,21 +52,233 @@ load_dotenv(ROOT_DIR / '.env')
 SECRET_KEY = os.environ.get('JWT_SECRET', 'alluz-energia-super-secret-key-2024')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 480
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+TOKEN_CACHE_SIZE = 1024
+# How long other instances may keep accepting tokens revoked by change-password
+TOKEN_VERSION_TTL = float(os.environ.get("TOKEN_VERSION_TTL", "30"))
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+AUTH_WORKERS = int(os.environ.get("AUTH_WORKERS", "2"))
+AUTH_MAX_PENDING = int(os.environ.get("AUTH_MAX_PENDING", "16"))
+# Hashes with a different cost are rehashed on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_desired_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_desired_rounds=BCRYPT_ROUNDS,
+)
 security = HTTPBearer()
 
 # Rate limiting
-rate_limit_store = defaultdict(list)
 RATE_LIMIT_WINDOW = 60
 RATE_LIMIT_MAX = 5
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "10000"))
+# Number of proxies in front of the app that append to X-Forwarded-For
+# (1 on Cloud Run); 0 ignores the header and uses the socket peer
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))
+
+# Site content cache
+SITE_CACHE_POLL_INTERVAL = float(os.environ.get("SITE_CACHE_POLL_INTERVAL", "15"))
+SITE_CACHED_COLLECTIONS = ["content", "plans", "faq"]
+FAQ_PROJECTION = {"_id": 0, "id": 1, "pergunta": 1, "resposta": 1}
+SITE_CACHE_CONTROL = os.environ.get("SITE_CACHE_CONTROL", "public, no-cache")
+
+# Lead ingestion: "direct" inserts each lead on its own, "batch" group-commits
+# concurrent submissions
+LEAD_INGEST_MODE = os.environ.get("LEAD_INGEST_MODE", "direct")
+LEAD_BATCH_WINDOW_MS = float(os.environ.get("LEAD_BATCH_WINDOW_MS", "5"))
+LEAD_BATCH_MAX_SIZE = int(os.environ.get("LEAD_BATCH_MAX_SIZE", "100"))
+# Resubmissions with the same phone or email inside this window are merged into
+# the earlier lead; 0 disables the check
+LEAD_DEDUP_WINDOW_HOURS = float(os.environ.get("LEAD_DEDUP_WINDOW_HOURS", "24"))
+# Changed answers from merged resubmissions kept on the lead, newest last
+LEAD_RESUBMISSIONS_KEPT = 20
+LEAD_PHONE_COUNTRY_CODE = "55"
+LEAD_FINGERPRINT_BATCH_SIZE = 1000
+
+# Admin lead stream (server-sent events)
+LEAD_STREAM_QUEUE_SIZE = int(os.environ.get("LEAD_STREAM_QUEUE_SIZE", "100"))
+LEAD_STREAM_HEARTBEAT = 15
+LEAD_STREAM_POLL_INTERVAL = float(os.environ.get("LEAD_STREAM_POLL_INTERVAL", "5"))
+# Reconnects replay from Last-Event-ID minus this margin, which absorbs clock
+# skew between the instances stamping created_at/updated_at
+LEAD_STREAM_REPLAY_OVERLAP = 30
+
+# Lead notifications: new leads queue one outbox entry per sink ("email",
+# "webhook"). OUTBOX_WORKER=inline delivers them from the API process; "off"
+# leaves delivery to `python worker.py`.
+OUTBOX_SINKS = [name.strip() for name in os.environ.get("OUTBOX_SINKS", "").split(",") if name.strip()]
+OUTBOX_WORKER = os.environ.get("OUTBOX_WORKER", "inline")
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_LEASE_SECONDS = 60
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_BASE = 5
+OUTBOX_BACKOFF_MAX = 3600
+OUTBOX_RETENTION_DAYS = 7
+OUTBOX_SINK_TIMEOUT = 10
+SMTP_HOST = os.environ.get("SMTP_HOST")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
+NOTIFY_EMAIL_FROM = os.environ.get("NOTIFY_EMAIL_FROM", "noreply@alluzenergia.com.br")
+NOTIFY_EMAIL_TO = [email.strip() for email in os.environ.get("NOTIFY_EMAIL_TO", "").split(",") if email.strip()]
+CRM_WEBHOOK_URL = os.environ.get("CRM_WEBHOOK_URL")
+CRM_WEBHOOK_TOKEN = os.environ.get("CRM_WEBHOOK_TOKEN")
+
+# Admin lead listing
+LEADS_PAGE_MAX = 500
+LEAD_COUNT_CACHE_TTL = 30
+LEAD_COUNT_CACHE_SIZE = 256
+EXPORT_FLUSH_SIZE = 64 * 1024
+EXPORT_BATCH_SIZE = 1000
+EXPORT_SPOOL_MEMORY = 8 * 1024 * 1024
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "2"))
+export_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="lead-export")
+
+# Lead file uploads
+BLOB_STORE = os.environ.get("BLOB_STORE", "gridfs")
+BLOB_STORE_PATH = Path(os.environ.get("BLOB_STORE_PATH", str(ROOT_DIR / "uploads")))
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(255 * 1024)))
+LEAD_FILE_KINDS = ("conta_luz", "monitoramento")
+# Attachments are previewed in the admin dashboard, so only types that cannot
+# carry script are accepted and served as themselves
+LEAD_FILE_TYPES = ("application/pdf", "image/png", "image/jpeg", "image/webp")
+# Whole-request admission limits, checked from Content-Length before the body is read
+UPLOAD_MAX_CONCURRENT = int(os.environ.get("UPLOAD_MAX_CONCURRENT", "4"))
+UPLOAD_MAX_INFLIGHT_BYTES = int(os.environ.get("UPLOAD_MAX_INFLIGHT_BYTES", str(64 * 1024 * 1024)))
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+UPLOAD_RETRY_AFTER = 5
+# Resumable uploads: attachments sent in checksummed parts of at most
+# UPLOAD_PART_SIZE bytes; unfinished sessions are swept after their TTL
+UPLOAD_PART_SIZE = int(os.environ.get("UPLOAD_PART_SIZE", str(256 * 1024)))
+UPLOAD_SESSION_TTL_HOURS = int(os.environ.get("UPLOAD_SESSION_TTL_HOURS", "24"))
+UPLOAD_SWEEP_INTERVAL = int(os.environ.get("UPLOAD_SWEEP_INTERVAL", "600"))
+# An assembly older than this is presumed dead and may be retried
+UPLOAD_ASSEMBLY_TIMEOUT = 120
+# Legacy leads kept their attachments inline; never ship those in list payloads
+LEAD_BLOB_PROJECTION = {"_id": 0, **{f"{kind}_arquivo_base64": 0 for kind in LEAD_FILE_KINDS}}
+
+# Migrations
+# Cloud Run (K_SERVICE) deploys migrate ahead of time; anywhere else a plain
+# `uvicorn server:app` brings an empty database up to date itself
+MIGRATIONS_ON_STARTUP = os.environ.get("MIGRATIONS_ON_STARTUP", "check" if os.environ.get("K_SERVICE") else "run")
+MIGRATION_LEASE_SECONDS = 60
+MIGRATION_LOCK_TIMEOUT = 300
 
 MONGO_URL = os.environ.get("MONGO_URL") or os.environ.get("MONGODB_URI")
 MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "alluz_oem")
+MONGO_WARM_CONNECTIONS = int(os.environ.get("MONGO_WARM_CONNECTIONS", "4"))
+READINESS_TIMEOUT = 2
 mongo_client: Optional[AsyncIOMotorClient] = None
 mongo_db: Optional[AsyncIOMotorDatabase] = None
+blob_store: Optional["BlobStore"] = None
+
+# Metrics
+# prometheus_client collectors are process-local and O(1) per observation;
+# route labels use the matched route template to keep cardinality bounded.
+# /metrics is only served to callers presenting METRICS_TOKEN; without one it
+# does not exist, since the service itself is publicly reachable.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served")
+MONGO_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command latency",
+    ["command", "collection"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+MONGO_COMMAND_FAILURES = Counter("mongodb_command_failures_total", "Failed MongoDB commands", ["command", "collection"])
+UPLOAD_BYTES = Counter("lead_upload_bytes_total", "Bytes received in lead attachments")
+UPLOAD_REJECTIONS = Counter("lead_upload_rejections_total", "Rejected lead attachments", ["reason"])
+UPLOADS_IN_FLIGHT = Gauge("lead_uploads_in_flight", "Upload requests admitted and not yet finished")
+UPLOAD_INFLIGHT_BYTES = Gauge("lead_upload_inflight_bytes", "Declared bytes of admitted upload requests")
+UPLOAD_SESSIONS_EXPIRED = Counter("lead_upload_sessions_expired_total", "Resumable uploads swept after their TTL")
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt hash/verify latency including executor queueing",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2, 5),
+)
+PASSWORD_HASH_REJECTIONS = Counter("password_hash_rejections_total", "Password operations rejected by the auth executor")
+RATE_LIMIT_REJECTIONS = Counter("rate_limit_rejections_total", "Requests rejected by the rate limiter")
+SITE_CACHE_REQUESTS = Counter("site_cache_requests_total", "Site snapshot lookups", ["result"])
+LEAD_STREAM_CLIENTS = Gauge("lead_stream_clients", "Connected admin lead stream clients")
+LEAD_STREAM_EVICTIONS = Counter("lead_stream_evictions_total", "Lead stream clients dropped for falling behind")
+OUTBOX_DELIVERIES = Counter("outbox_deliveries_total", "Outbox delivery attempts", ["sink", "result"])
+LEAD_BATCH_SIZE = Histogram(
+    "lead_insert_batch_size",
+    "Leads written per group-committed insert_many",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status_code)
+            ).observe(time.perf_counter() - start)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        # (connection, request_id) -> collection; only the started event names it
+        self._collections = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_DURATION.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_DURATION.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(event.command_name, collection).inc()
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
 
 # Create the main app
-app = FastAPI(title="Alluz Energia API")
+app = FastAPI(title="Alluz Energia API", lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # Models
@@ -79,10 +318,14 @@ class LeadResponse(BaseModel):
     observacoes: Optional[str] = None
     conta_luz_arquivo_nome: Optional[str] = None
     conta_luz_arquivo_tipo: Optional[str] = None
-    conta_luz_arquivo_base64: Optional[str] = None
+    conta_luz_arquivo_tamanho: Optional[int] = None
+    conta_luz_arquivo_sha256: Optional[str] = None
     monitoramento_arquivo_nome: Optional[str] = None
     monitoramento_arquivo_tipo: Optional[str] = None
-    monitoramento_arquivo_base64: Optional[str] = None
+    monitoramento_arquivo_tamanho: Optional[int] = None
+    monitoramento_arquivo_sha256: Optional[str] = None
+    submissions: int = 1
+    resubmissions: Optional[List[dict]] = None
     status: str
     created_at: str
 
@@ -110,6 +353,9 @@ class ContentUpdate(BaseModel):
     key: str
     value: str
 
+class ContentBulkUpdate(BaseModel):
+    items: List[ContentUpdate]
+
 class WhatsAppConfig(BaseModel):
     numero: str
     mensagem_template: str
@@ -128,34 +374,146 @@ class FAQUpdate(BaseModel):
     pergunta: str
     resposta: str
 
+class FAQOrder(BaseModel):
+    ids: List[str]
+
+class UploadCreate(BaseModel):
+    kind: str
+    nome: str
+    tipo: Optional[str] = None
+    tamanho: int
+
 # Database initialization
 async def init_db():
-    global mongo_client, mongo_db
+    global mongo_client, mongo_db, blob_store, rate_limiter, outbox_sinks
     if not MONGO_URL:
         raise RuntimeError("Configure MONGO_URL (MongoDB Atlas connection string) no ambiente")
+    if LEAD_INGEST_MODE not in ("direct", "batch"):
+        raise RuntimeError(f"LEAD_INGEST_MODE inválido: {LEAD_INGEST_MODE}")
+    if OUTBOX_WORKER not in ("inline", "off"):
+        raise RuntimeError(f"OUTBOX_WORKER inválido: {OUTBOX_WORKER}")
 
-    mongo_client = AsyncIOMotorClient(MONGO_URL)
+    mongo_client = AsyncIOMotorClient(MONGO_URL, event_listeners=[pool_stats, mongo_command_metrics])
     mongo_db = mongo_client[MONGO_DB_NAME]
-    await mongo_client.admin.command("ping")
+    blob_store = create_blob_store(mongo_db)
+    rate_limiter = create_rate_limiter(mongo_db)
+    outbox_sinks = create_outbox_sinks()
+    await ensure_schema(mongo_db)
+
+
+# Connection pool telemetry
+# pymongo reports pool events from its worker threads, hence the lock
+class PoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.wait_queue = 0
+        self.checkout_failures = 0
+
+    def _add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "wait_queue": self.wait_queue,
+                "checkout_failures": self.checkout_failures,
+            }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(open=-1)
+
+    def connection_check_out_started(self, event):
+        self._add(wait_queue=1)
+
+    def connection_check_out_failed(self, event):
+        self._add(wait_queue=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._add(wait_queue=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._add(checked_out=-1)
+
 
-    await mongo_db.admins.create_index([("username", ASCENDING)], unique=True)
-    await mongo_db.leads.create_index([("id", ASCENDING)], unique=True)
-    await mongo_db.leads.create_index([("created_at", DESCENDING)])
-    await mongo_db.plans.create_index([("id", ASCENDING)], unique=True)
-    await mongo_db.plans.create_index([("ordem", ASCENDING)])
-    await mongo_db.content.create_index([("key", ASCENDING)], unique=True)
+pool_stats = PoolStats()
 
-    if await mongo_db.admins.count_documents({}) == 0:
-        await mongo_db.admins.insert_one(
+
+class PoolStatsCollector:
+    def collect(self):
+        for name, value in pool_stats.snapshot().items():
+            yield GaugeMetricFamily(f"mongodb_pool_{name}", f"MongoDB connection pool: {name.replace('_', ' ')}", value=value)
+
+
+REGISTRY.register(PoolStatsCollector())
+
+
+# Migrations
+# Schema changes and seed data are versioned steps recorded in meta.schema.
+# Pending steps run under a lease in meta.migration_lock, so instances booting
+# together never apply the same step twice. Deploys apply them ahead of time
+# with `python migrate.py`, and deployed instances only verify the version;
+# outside Cloud Run the app applies them at startup unless
+# MIGRATIONS_ON_STARTUP=check. If the lease is lost
+# mid-run, the migrations are cancelled and MigrationLeaseLost is raised.
+class Migration(NamedTuple):
+    version: int
+    name: str
+    run: Callable[[AsyncIOMotorDatabase], Awaitable[None]]
+
+
+async def create_base_indexes(db: AsyncIOMotorDatabase):
+    await asyncio.gather(
+        db.admins.create_index([("username", ASCENDING)], unique=True),
+        db.leads.create_index([("id", ASCENDING)], unique=True),
+        db.leads.create_index([("created_at", DESCENDING)]),
+        db.leads.create_index([("created_at", DESCENDING), ("id", DESCENDING)]),
+        db.plans.create_index([("id", ASCENDING)], unique=True),
+        db.plans.create_index([("ordem", ASCENDING)]),
+        db.content.create_index([("key", ASCENDING)], unique=True),
+        db.faq.create_index([("id", ASCENDING)], unique=True),
+        db.faq.create_index([("ordem", ASCENDING)]),
+        db.rate_limits.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    )
+
+
+async def seed_admin(db: AsyncIOMotorDatabase):
+    if await db.admins.count_documents({}) == 0:
+        await db.admins.insert_one(
             {
                 "id": str(uuid.uuid4()),
                 "username": "admin",
-                "password_hash": pwd_context.hash("admin123"),
+                "password_hash": await password_hasher.hash("admin123"),
                 "created_at": datetime.now(timezone.utc).isoformat(),
             }
         )
 
-    if await mongo_db.plans.count_documents({}) == 0:
+
+async def seed_plans(db: AsyncIOMotorDatabase):
+    if await db.plans.count_documents({}) == 0:
         plans = [
                 {
                     "id": str(uuid.uuid4()),
@@ -197,9 +555,11 @@ async def init_db():
                     "badge": None
                 }
         ]
-        await mongo_db.plans.insert_many(plans)
+        await db.plans.insert_many(plans)
 
-    if await mongo_db.content.count_documents({}) == 0:
+
+async def seed_content(db: AsyncIOMotorDatabase):
+    if await db.content.count_documents({}) == 0:
         default_content = {
                 "hero_titulo": "Acompanhamento remoto do seu sistema solar",
                 "hero_subtitulo": "Monitoramento mensal, excedente/créditos e orientação para você não ficar sem suporte",
@@ -234,16 +594,1309 @@ async def init_db():
                 "footer_razao_social": "Alluz Energia Sustentável e Tecnologia da Informacao",
                 "footer_cnpj": "34.782.317/0001-49"
         }
-        await mongo_db.content.insert_many(
+        await db.content.insert_many(
                 [{"key": key, "value": value} for key, value in default_content.items()]
             )
 
 
+async def seed_defaults(db: AsyncIOMotorDatabase):
+    await asyncio.gather(seed_admin(db), seed_plans(db), seed_content(db))
+
+
+async def migrate_faq_blob(db: AsyncIOMotorDatabase):
+    # One-time move of the legacy JSON blob under content.faq_itens into the
+    # faq collection. Ids are deterministic, so instances racing through this
+    # collide on the unique index instead of duplicating items.
+    faq_doc = await db.content.find_one({"key": "faq_itens"}, {"_id": 0, "value": 1})
+    if faq_doc is None:
+        return
+
+    items = []
+    try:
+        parsed = json.loads(faq_doc.get("value") or "[]")
+        if isinstance(parsed, list):
+            items = [
+                {
+                    "id": item.get("id") or str(index),
+                    "pergunta": item.get("pergunta", ""),
+                    "resposta": item.get("resposta", ""),
+                    "ordem": index,
+                }
+                for index, item in enumerate(parsed)
+                if isinstance(item, dict)
+            ]
+    except json.JSONDecodeError:
+        logger.warning("Legacy faq_itens is not valid JSON; dropping it")
+
+    if items and await db.faq.count_documents({}) == 0:
+        try:
+            await db.faq.insert_many(items, ordered=False)
+        except BulkWriteError as exc:
+            if any(error.get("code") != 11000 for error in exc.details.get("writeErrors", [])):
+                raise
+    await db.content.delete_one({"key": "faq_itens"})
+
+
+async def fingerprint_leads(db: AsyncIOMotorDatabase):
+    # Partial indexes: leads without a phone (form) or email (landing) stay out
+    await asyncio.gather(
+        db.leads.create_index(
+            [("telefone_e164", ASCENDING), ("created_at", DESCENDING)],
+            partialFilterExpression={"telefone_e164": {"$type": "string"}},
+        ),
+        db.leads.create_index(
+            [("email_normalizado", ASCENDING), ("created_at", DESCENDING)],
+            partialFilterExpression={"email_normalizado": {"$type": "string"}},
+        ),
+    )
+    await backfill_lead_fingerprints(db)
+
+
+async def backfill_lead_fingerprints(db: AsyncIOMotorDatabase) -> int:
+    # Resumable: leads already carrying fingerprints are skipped
+    updated = 0
+    batch = []
+    cursor = db.leads.find(
+        {"telefone_e164": {"$exists": False}},
+        {"_id": 1, "telefone": 1, "email": 1},
+        batch_size=LEAD_FINGERPRINT_BATCH_SIZE,
+    )
+    async for lead in cursor:
+        fingerprints = lead_fingerprints(lead.get("telefone"), lead.get("email"))
+        batch.append(UpdateOne({"_id": lead["_id"]}, {"$set": fingerprints, "$max": {"submissions": 1}}))
+        if len(batch) >= LEAD_FINGERPRINT_BATCH_SIZE:
+            await db.leads.bulk_write(batch, ordered=False)
+            updated += len(batch)
+            batch = []
+    if batch:
+        await db.leads.bulk_write(batch, ordered=False)
+        updated += len(batch)
+    return updated
+
+
+async def create_lead_filter_indexes(db: AsyncIOMotorDatabase):
+    # Equality fields first, then the listing sort, so filtered pages walk the
+    # index in order and stop after `limit` keys
+    sort_keys = [("created_at", DESCENDING), ("id", DESCENDING)]
+    await asyncio.gather(
+        db.leads.create_index([("status", ASCENDING), *sort_keys]),
+        db.leads.create_index([("plano", ASCENDING), *sort_keys]),
+        db.leads.create_index([("status", ASCENDING), ("plano", ASCENDING), *sort_keys]),
+    )
+
+
+async def create_lead_search_index(db: AsyncIOMotorDatabase):
+    # Text indexes (v3) fold case and diacritics, and the Portuguese stemmer
+    # matches "instalação"/"instalacao"/"instalações" alike
+    await db.leads.create_index(
+        [(field, TEXT) for field in ("nome", "empresa", "cidade", "email", "observacoes")],
+        name="lead_search",
+        default_language="portuguese",
+        language_override="idioma_busca",
+        weights={"nome": 10, "empresa": 8, "email": 5, "cidade": 3, "observacoes": 1},
+    )
+
+
+async def create_outbox_indexes(db: AsyncIOMotorDatabase):
+    await asyncio.gather(
+        db.outbox.create_index([("status", ASCENDING), ("available_at", ASCENDING)]),
+        db.outbox.create_index([("delivered_at", ASCENDING)], expireAfterSeconds=OUTBOX_RETENTION_DAYS * 86400),
+    )
+
+
+async def create_upload_indexes(db: AsyncIOMotorDatabase):
+    await asyncio.gather(
+        db.uploads.create_index([("id", ASCENDING)], unique=True),
+        db.uploads.create_index([("expires_at", ASCENDING)]),
+    )
+
+
+async def create_lead_updated_index(db: AsyncIOMotorDatabase):
+    # Serves the lead stream's reconnect replay
+    await db.leads.create_index([("updated_at", ASCENDING)], sparse=True)
+
+
+async def build_lead_stats(db: AsyncIOMotorDatabase):
+    await rebuild_lead_stats(db)
+
+
+MIGRATIONS = [
+    Migration(1, "create_base_indexes", create_base_indexes),
+    Migration(2, "seed_defaults", seed_defaults),
+    Migration(3, "migrate_faq_blob", migrate_faq_blob),
+    Migration(4, "fingerprint_leads", fingerprint_leads),
+    Migration(5, "create_lead_filter_indexes", create_lead_filter_indexes),
+    Migration(6, "build_lead_stats", build_lead_stats),
+    Migration(7, "create_lead_search_index", create_lead_search_index),
+    Migration(8, "create_outbox_indexes", create_outbox_indexes),
+    Migration(9, "create_upload_indexes", create_upload_indexes),
+    Migration(10, "create_lead_updated_index", create_lead_updated_index),
+]
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+class MigrationLeaseLost(RuntimeError):
+    pass
+
+
+class MigrationLock:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.owner = str(uuid.uuid4())
+        self._renewer: Optional[asyncio.Task] = None
+        self._holder: Optional[asyncio.Task] = None
+        self.lost = False
+
+    async def _claim(self):
+        now = datetime.now(timezone.utc)
+        # Matches only a free, expired or already-owned lease; otherwise the
+        # upsert collides with the live lease on _id
+        await self.db.meta.find_one_and_update(
+            {"_id": "migration_lock", "$or": [{"expires_at": {"$lt": now}}, {"owner": self.owner}]},
+            {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=MIGRATION_LEASE_SECONDS)}},
+            upsert=True,
+        )
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(MIGRATION_LEASE_SECONDS / 3)
+            try:
+                await self._claim()
+            except DuplicateKeyError:
+                # Someone else holds the lease now; stop migrating under it
+                logger.error("Migration lease lost; cancelling migrations")
+                self.lost = True
+                self._holder.cancel()
+                return
+            except PyMongoError as exc:
+                # The lease outlives a couple of missed renewals
+                logger.warning("Migration lease renewal failed: %s", exc)
+
+    async def __aenter__(self):
+        deadline = time.monotonic() + MIGRATION_LOCK_TIMEOUT
+        while True:
+            try:
+                await self._claim()
+                break
+            except DuplicateKeyError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Timed out waiting for the migration lock")
+                await asyncio.sleep(1)
+        self._holder = asyncio.current_task()
+        self._renewer = asyncio.create_task(self._renew())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._renewer.cancel()
+        try:
+            await self._renewer
+        except asyncio.CancelledError:
+            pass
+        if self.lost:
+            # Replace the CancelledError our own cancel() caused
+            self._holder.uncancel()
+            raise MigrationLeaseLost("Migration lease lost to another instance; rerun `python migrate.py`")
+        await self.db.meta.delete_one({"_id": "migration_lock", "owner": self.owner})
+
+
+async def get_schema_version(db: AsyncIOMotorDatabase) -> int:
+    doc = await db.meta.find_one({"_id": "schema"}, {"version": 1})
+    return doc.get("version", 0) if doc else 0
+
+
+async def run_migrations(db: AsyncIOMotorDatabase) -> List[str]:
+    applied = []
+    async with MigrationLock(db):
+        # Another instance may have finished while we waited for the lease
+        current = await get_schema_version(db)
+        for migration in MIGRATIONS:
+            if migration.version <= current:
+                continue
+            logger.info("Applying migration %s (%s)", migration.version, migration.name)
+            await migration.run(db)
+            await db.meta.update_one({"_id": "schema"}, {"$max": {"version": migration.version}}, upsert=True)
+            applied.append(migration.name)
+    return applied
+
+
+async def ensure_schema(db: AsyncIOMotorDatabase):
+    current = await get_schema_version(db)
+    if current >= SCHEMA_VERSION:
+        return
+    if MIGRATIONS_ON_STARTUP == "check":
+        raise RuntimeError(
+            f"Schema do banco na versão {current}, esperado {SCHEMA_VERSION}; execute `python migrate.py`"
+        )
+    await run_migrations(db)
+
+
 def get_db() -> AsyncIOMotorDatabase:
     if mongo_db is None:
         raise HTTPException(status_code=500, detail="Banco de dados não inicializado")
     return mongo_db
 
+
+# Flipped off the first time the server reports it cannot run transactions
+# (standalone mongod); writes are then applied without one.
+transactions_enabled = True
+
+
+async def run_transaction(db: AsyncIOMotorDatabase, write: Callable[..., Awaitable[None]]):
+    global transactions_enabled
+    if transactions_enabled:
+        try:
+            async with await db.client.start_session() as session:
+                await session.with_transaction(write)
+            return
+        except (OperationFailure, ConfigurationError) as exc:
+            if isinstance(exc, OperationFailure) and exc.code != 20:
+                raise
+            logger.info("MongoDB transactions unavailable (%s); writing without them", exc)
+            transactions_enabled = False
+    await write()
+
+
+# Server errors meaning change streams can never work on this deployment
+# (standalone mongod), as opposed to transient ones such as a resume token
+# that fell off the oplog
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573, 40324, 115}
+
+
+def change_streams_unsupported(exc: PyMongoError) -> bool:
+    return isinstance(exc, OperationFailure) and exc.code in CHANGE_STREAM_UNSUPPORTED_CODES
+
+# Site content cache
+# Each worker keeps an in-memory snapshot of `content`, `plans` and `faq`. Admin writes
+# invalidate the local snapshot and bump `meta.site.version`; other instances
+# pick the change up through a change stream or, without a replica set, by
+# polling the version document.
+class EncodedBody(NamedTuple):
+    digest: str
+    identity: bytes
+    gzip: bytes
+    br: Optional[bytes]
+
+
+class SiteSnapshot(NamedTuple):
+    version: int
+    content: dict
+    plans: list
+    bodies: dict
+
+
+def encode_json_body(payload) -> EncodedBody:
+    # Same byte layout as FastAPI's JSONResponse
+    raw = json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+    return EncodedBody(
+        digest=hashlib.sha256(raw).hexdigest()[:32],
+        identity=raw,
+        gzip=gzip.compress(raw, compresslevel=9, mtime=0),
+        br=brotli.compress(raw, quality=11) if brotli is not None else None,
+    )
+
+
+class SiteCache:
+    def __init__(self):
+        self.snapshot: Optional[SiteSnapshot] = None
+        self._generation = 0
+        self._dirty = True
+        self._lock = asyncio.Lock()
+        self._remote_version: Optional[int] = None
+        self._watcher: Optional[asyncio.Task] = None
+
+    def invalidate(self):
+        self._dirty = True
+
+    async def get(self, db: AsyncIOMotorDatabase) -> SiteSnapshot:
+        snapshot = self.snapshot
+        if snapshot is not None and not self._dirty:
+            SITE_CACHE_REQUESTS.labels("hit").inc()
+            return snapshot
+        SITE_CACHE_REQUESTS.labels("miss").inc()
+        async with self._lock:
+            if self.snapshot is None or self._dirty:
+                # Invalidations that land during the load mark the cache dirty again
+                self._dirty = False
+                try:
+                    self.snapshot = await self._load(db)
+                except Exception:
+                    self._dirty = True
+                    raise
+            return self.snapshot
+
+    async def _load(self, db: AsyncIOMotorDatabase) -> SiteSnapshot:
+        content = {}
+        async for row in db.content.find({}, {"_id": 0, "key": 1, "value": 1}):
+            content[row["key"]] = row["value"]
+        # The landing page still reads the FAQ as a JSON string under faq_itens
+        faq = [row async for row in db.faq.find({}, FAQ_PROJECTION).sort([("ordem", ASCENDING), ("id", ASCENDING)])]
+        content["faq_itens"] = json.dumps(faq)
+        plans = [
+            PlanResponse(**row).model_dump()
+            async for row in db.plans.find({}, {"_id": 0}).sort("ordem", ASCENDING)
+        ]
+        bodies = {
+            "content": encode_json_body(content),
+            "plans": encode_json_body(plans),
+            "bootstrap": encode_json_body({"content": content, "plans": plans}),
+        }
+        self._generation += 1
+        return SiteSnapshot(self._generation, content, plans, bodies)
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch(db))
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch(self, db: AsyncIOMotorDatabase):
+        pipeline = [{"$match": {"ns.coll": {"$in": SITE_CACHED_COLLECTIONS}}}]
+        while True:
+            try:
+                async with db.watch(pipeline) as stream:
+                    # Catch up on anything missed while the stream was closed
+                    self.invalidate()
+                    async for _ in stream:
+                        self.invalidate()
+            except PyMongoError as exc:
+                if change_streams_unsupported(exc):
+                    logger.info("Change streams unavailable (%s); falling back to polling for site cache", exc)
+                    await self._poll(db)
+                logger.warning("Site cache change stream interrupted: %s", exc)
+                self.invalidate()
+                await asyncio.sleep(SITE_CACHE_POLL_INTERVAL)
+
+    async def _poll(self, db: AsyncIOMotorDatabase):
+        while True:
+            try:
+                doc = await db.meta.find_one({"_id": "site"}, {"version": 1})
+                version = doc.get("version", 0) if doc else 0
+                if version != self._remote_version:
+                    self._remote_version = version
+                    self.invalidate()
+            except PyMongoError as exc:
+                logger.warning("Site cache polling failed: %s", exc)
+            await asyncio.sleep(SITE_CACHE_POLL_INTERVAL)
+
+
+site_cache = SiteCache()
+
+
+async def invalidate_site_cache(db: AsyncIOMotorDatabase, session=None):
+    site_cache.invalidate()
+    await db.meta.update_one({"_id": "site"}, {"$inc": {"version": 1}}, upsert=True, session=session)
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def _etag_matches(header: Optional[str], digest: str) -> bool:
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        # Every content-coding of the same body shares the digest prefix
+        if tag.strip('"').split("-", 1)[0] == digest:
+            return True
+    return False
+
+
+def encoded_json_response(request: Request, body: EncodedBody) -> Response:
+    headers = {"Cache-Control": SITE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    if body.br is not None and "br" in accepted:
+        content, headers["Content-Encoding"], etag = body.br, "br", f'"{body.digest}-br"'
+    elif "gzip" in accepted:
+        content, headers["Content-Encoding"], etag = body.gzip, "gzip", f'"{body.digest}-gzip"'
+    else:
+        content, etag = body.identity, f'"{body.digest}"'
+    headers["ETag"] = etag
+
+    if _etag_matches(request.headers.get("if-none-match"), body.digest):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+# Admin lead stream
+# A single change stream on `leads` per process, opened while at least one
+# dashboard is connected, fans events out to per-client queues. A client whose
+# queue fills up is evicted (its stream ends with an `evicted` event) instead
+# of buffering without bound. Events carry their publication time as the SSE
+# id, so a client reconnecting with Last-Event-ID is sent the leads created or
+# updated since then instead of reloading the list. Without change streams,
+# new leads are picked up by polling created_at.
+def format_lead_event(event: str, data: dict, event_id: Optional[str] = None) -> str:
+    prefix = f"id: {event_id}\n" if event_id else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class LeadFeed:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers: set = set()
+        self._watcher: Optional[asyncio.Task] = None
+
+    def subscribe(self, db: AsyncIOMotorDatabase) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        LEAD_STREAM_CLIENTS.set(len(self.subscribers))
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch(db))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        # Runs while the response task is being cancelled, so it must not await
+        self.subscribers.discard(queue)
+        LEAD_STREAM_CLIENTS.set(len(self.subscribers))
+        if not self.subscribers:
+            self.stop()
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def publish(self, event: str, data: dict):
+        message = format_lead_event(event, data, datetime.now(timezone.utc).isoformat())
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._evict(queue)
+
+    def _evict(self, queue: asyncio.Queue):
+        LEAD_STREAM_EVICTIONS.inc()
+        self._disconnect(queue)
+
+    def _disconnect(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+        LEAD_STREAM_CLIENTS.set(len(self.subscribers))
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def _publish_change(self, change: dict):
+        lead = change.get("fullDocument")
+        if not lead:
+            return
+        if change["operationType"] == "insert":
+            self.publish("lead.created", lead_event_fields(lead))
+        elif change["operationType"] == "update":
+            updated = change.get("updateDescription", {}).get("updatedFields", {})
+            self.publish("lead.updated", {"id": lead["id"], **lead_event_fields(updated)})
+        else:
+            self.publish("lead.updated", lead_event_fields(lead))
+
+    async def _watch(self, db: AsyncIOMotorDatabase):
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+            {"$project": {f"fullDocument.{kind}_arquivo_base64": 0 for kind in LEAD_FILE_KINDS}},
+        ]
+        resume_token = None
+        while True:
+            try:
+                async with db.leads.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._publish_change(change)
+            except PyMongoError as exc:
+                if change_streams_unsupported(exc):
+                    logger.info("Change streams unavailable (%s); polling for new leads", exc)
+                    await self._poll(db)
+                logger.warning("Lead change stream interrupted: %s", exc)
+                if isinstance(exc, OperationFailure):
+                    # The resume point may be gone; reopen from now and let
+                    # clients reconnect to replay what they missed
+                    resume_token = None
+                    for queue in list(self.subscribers):
+                        self._disconnect(queue)
+                await asyncio.sleep(LEAD_STREAM_POLL_INTERVAL)
+
+    async def _poll(self, db: AsyncIOMotorDatabase):
+        last_seen = datetime.now(timezone.utc).isoformat()
+        while True:
+            await asyncio.sleep(LEAD_STREAM_POLL_INTERVAL)
+            try:
+                rows = db.leads.find({"created_at": {"$gt": last_seen}}, LEAD_BLOB_PROJECTION).sort(
+                    "created_at", ASCENDING
+                )
+                async for lead in rows:
+                    last_seen = lead["created_at"]
+                    self.publish("lead.created", lead_event_fields(lead))
+            except PyMongoError as exc:
+                logger.warning("Lead stream polling failed: %s", exc)
+
+
+def lead_event_fields(lead: dict) -> dict:
+    return {field: value for field, value in lead.items() if field in LeadResponse.model_fields}
+
+
+def lead_stream_replay_since(last_event_id: Optional[str]) -> Optional[str]:
+    try:
+        published_at = datetime.fromisoformat(last_event_id or "")
+    except ValueError:
+        return None
+    if published_at.tzinfo is None:
+        return None
+    return (published_at - timedelta(seconds=LEAD_STREAM_REPLAY_OVERLAP)).astimezone(timezone.utc).isoformat()
+
+
+async def replay_lead_events(db: AsyncIOMotorDatabase, since: str) -> Optional[List[str]]:
+    # None when more changed than a queue holds; the client then reloads
+    rows = await (
+        db.leads.find({"$or": [{"created_at": {"$gt": since}}, {"updated_at": {"$gt": since}}]}, LEAD_BLOB_PROJECTION)
+        .sort("created_at", ASCENDING)
+        .limit(LEAD_STREAM_QUEUE_SIZE + 1)
+        .to_list(None)
+    )
+    if len(rows) > LEAD_STREAM_QUEUE_SIZE:
+        return None
+    return [
+        format_lead_event("lead.created" if row["created_at"] > since else "lead.updated", lead_event_fields(row))
+        for row in rows
+    ]
+
+
+lead_feed = LeadFeed(LEAD_STREAM_QUEUE_SIZE)
+
+# Lead notifications (transactional outbox)
+# Outbox entries are inserted in the same transaction as their lead and
+# delivered off the request path. Workers claim due entries in batches by
+# pushing `available_at` one lease into the future under a fresh lease id, so a
+# crashed worker's entries become due again on their own. Failures back off
+# exponentially; after OUTBOX_MAX_ATTEMPTS an entry is parked as "failed".
+# Delivery is at-least-once, so sinks receive the entry id to deduplicate.
+class OutboxSink(ABC):
+    @abstractmethod
+    async def deliver(self, entries: List[dict]) -> dict:
+        # Returns {entry _id: error message} for entries that were not delivered
+        ...
+
+
+class EmailSink(OutboxSink):
+    def __init__(self, host: str, port: int, username: Optional[str], password: Optional[str], starttls: bool,
+                 sender: str, recipients: List[str]):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender
+        self.recipients = recipients
+
+    def _message(self, entry: dict) -> EmailMessage:
+        lead = entry["payload"]
+        message = EmailMessage()
+        message["Subject"] = f"Novo lead: {lead.get('nome', '')} ({lead.get('plano') or 'sem plano'})"
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message["X-Outbox-Id"] = str(entry["_id"])
+        labels = {
+            "nome": "Nome",
+            "empresa": "Empresa",
+            "email": "Email",
+            "telefone": "Telefone",
+            "cidade": "Cidade",
+            "plano": "Plano",
+            "potencia": "Potência",
+            "concessionaria": "Concessionária",
+            "observacoes": "Observações",
+            "created_at": "Data",
+        }
+        message.set_content("\n".join(f"{label}: {lead[field]}" for field, label in labels.items() if lead.get(field)))
+        return message
+
+    def _send(self, entries: List[dict]) -> dict:
+        failures = {}
+        with smtplib.SMTP(self.host, self.port, timeout=OUTBOX_SINK_TIMEOUT) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            for entry in entries:
+                try:
+                    smtp.send_message(self._message(entry))
+                except smtplib.SMTPException as exc:
+                    failures[entry["_id"]] = str(exc)
+        return failures
+
+    async def deliver(self, entries: List[dict]) -> dict:
+        return await asyncio.to_thread(self._send, entries)
+
+
+class WebhookSink(OutboxSink):
+    # One POST per batch; any non-2xx response retries the whole batch
+    def __init__(self, url: str, token: Optional[str]):
+        self.url = url
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    async def deliver(self, entries: List[dict]) -> dict:
+        events = [
+            {"id": str(entry["_id"]), "event": entry["event"], "lead": entry["payload"]}
+            for entry in entries
+        ]
+        async with httpx.AsyncClient(timeout=OUTBOX_SINK_TIMEOUT) as client:
+            response = await client.post(self.url, json={"events": events}, headers=self.headers)
+            response.raise_for_status()
+        return {}
+
+
+outbox_sinks: dict = {}
+
+
+def create_outbox_sinks() -> dict:
+    sinks = {}
+    for name in OUTBOX_SINKS:
+        if name == "email":
+            if not SMTP_HOST or not NOTIFY_EMAIL_TO:
+                raise RuntimeError("Configure SMTP_HOST e NOTIFY_EMAIL_TO para o sink de email")
+            sinks[name] = EmailSink(
+                SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, SMTP_STARTTLS, NOTIFY_EMAIL_FROM, NOTIFY_EMAIL_TO
+            )
+        elif name == "webhook":
+            if not CRM_WEBHOOK_URL:
+                raise RuntimeError("Configure CRM_WEBHOOK_URL para o sink de webhook")
+            sinks[name] = WebhookSink(CRM_WEBHOOK_URL, CRM_WEBHOOK_TOKEN)
+        else:
+            raise RuntimeError(f"OUTBOX_SINKS inválido: {name}")
+    return sinks
+
+
+def outbox_entries(lead: dict) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    payload = lead_event_fields(lead)
+    return [
+        {
+            "sink": sink,
+            "event": "lead.created",
+            "lead_id": lead["id"],
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "available_at": now,
+            "created_at": now,
+        }
+        for sink in outbox_sinks
+    ]
+
+
+def outbox_backoff(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1)
+
+
+class OutboxWorker:
+    def __init__(self, batch_size: int, lease_seconds: int):
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self, db: AsyncIOMotorDatabase):
+        while True:
+            try:
+                claimed = await self.run_once(db)
+            except PyMongoError as exc:
+                logger.warning("Outbox delivery round failed: %s", exc)
+                claimed = 0
+            if claimed < self.batch_size:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_once(self, db: AsyncIOMotorDatabase) -> int:
+        entries = await self.claim(db)
+        by_sink = {}
+        for entry in entries:
+            by_sink.setdefault(entry["sink"], []).append(entry)
+        await asyncio.gather(*(self.deliver(db, sink, batch) for sink, batch in by_sink.items()))
+        return len(entries)
+
+    async def claim(self, db: AsyncIOMotorDatabase) -> List[dict]:
+        now = datetime.now(timezone.utc)
+        due = {"status": "pending", "available_at": {"$lte": now}}
+        ids = [
+            row["_id"]
+            async for row in db.outbox.find(due, {"_id": 1}).sort("available_at", ASCENDING).limit(self.batch_size)
+        ]
+        if not ids:
+            return []
+        # Re-checking `due` makes concurrent workers split the candidates
+        lease = str(uuid.uuid4())
+        await db.outbox.update_many(
+            {"_id": {"$in": ids}, **due},
+            {
+                "$set": {"lease": lease, "available_at": now + timedelta(seconds=self.lease_seconds)},
+                "$inc": {"attempts": 1},
+            },
+        )
+        return [row async for row in db.outbox.find({"_id": {"$in": ids}, "lease": lease})]
+
+    async def deliver(self, db: AsyncIOMotorDatabase, sink_name: str, entries: List[dict]):
+        sink = outbox_sinks.get(sink_name)
+        try:
+            if sink is None:
+                raise RuntimeError(f"Sink {sink_name} não configurado neste processo")
+            failures = await sink.deliver(entries)
+        except Exception as exc:
+            logger.warning("Outbox sink %s failed for %d entries: %s", sink_name, len(entries), exc)
+            failures = {entry["_id"]: str(exc) for entry in entries}
+
+        now = datetime.now(timezone.utc)
+        operations = []
+        for entry in entries:
+            # Only the lease holder may settle an entry
+            owned = {"_id": entry["_id"], "lease": entry["lease"]}
+            if entry["_id"] not in failures:
+                result = "delivered"
+                update = {"$set": {"status": "delivered", "delivered_at": now}, "$unset": {"lease": ""}}
+            elif entry["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+                result = "failed"
+                update = {"$set": {"status": "failed", "last_error": failures[entry["_id"]]}, "$unset": {"lease": ""}}
+            else:
+                result = "retry"
+                retry_at = now + timedelta(seconds=outbox_backoff(entry["attempts"]))
+                update = {
+                    "$set": {"available_at": retry_at, "last_error": failures[entry["_id"]]},
+                    "$unset": {"lease": ""},
+                }
+            OUTBOX_DELIVERIES.labels(sink_name, result).inc()
+            operations.append(UpdateOne(owned, update))
+        await db.outbox.bulk_write(operations, ordered=False)
+
+
+outbox_worker = OutboxWorker(OUTBOX_BATCH_SIZE, OUTBOX_LEASE_SECONDS)
+
+# Password hashing
+# bcrypt takes hundreds of milliseconds per call, so it runs on a small
+# dedicated pool. Once AUTH_MAX_PENDING operations are queued or running,
+# new ones are rejected with 503 instead of piling up behind a flood.
+class PasswordHasher:
+    def __init__(self, context: CryptContext, max_workers: int, max_pending: int):
+        self.context = context
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self.pending = 0
+        self.calls = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    async def _run(self, operation: str, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            PASSWORD_HASH_REJECTIONS.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Servidor ocupado. Tente novamente em instantes.",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            elapsed = time.perf_counter() - start
+            self.calls += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+            PASSWORD_HASH_DURATION.labels(operation).observe(elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        return await self._run("verify", self.context.verify_and_update, password, password_hash)
+
+    def stats(self) -> dict:
+        return {
+            "rounds": BCRYPT_ROUNDS,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "avg_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+            "max_seconds": self.max_seconds,
+        }
+
+
+password_hasher = PasswordHasher(pwd_context, AUTH_WORKERS, AUTH_MAX_PENDING)
+
+# Blob storage for lead attachments
+# Uploads are written chunk by chunk, so peak memory per file is bounded by
+# UPLOAD_CHUNK_SIZE. Leads keep only the blob id plus name/type/size/hash.
+class BlobReader(ABC):
+    length: int
+
+    @abstractmethod
+    async def seek(self, offset: int):
+        ...
+
+    @abstractmethod
+    async def read(self, size: int) -> bytes:
+        ...
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+
+class BlobStore(ABC):
+    @abstractmethod
+    async def save(self, blob_id: str, chunks: AsyncIterator[bytes], filename: Optional[str], content_type: Optional[str]):
+        ...
+
+    @abstractmethod
+    async def open(self, blob_id: str) -> BlobReader:
+        # Raises FileNotFoundError when the blob does not exist
+        ...
+
+    @abstractmethod
+    async def delete(self, blob_id: str):
+        ...
+
+
+class GridFSBlobReader(BlobReader):
+    def __init__(self, grid_out):
+        self.grid_out = grid_out
+        self.length = grid_out.length
+
+    async def seek(self, offset):
+        self.grid_out.seek(offset)
+
+    async def read(self, size):
+        return await self.grid_out.read(size)
+
+    async def close(self):
+        # Closing kills the server-side chunk cursor, a blocking round trip
+        await asyncio.get_running_loop().run_in_executor(None, self.grid_out.close)
+
+
+class LocalBlobReader(BlobReader):
+    def __init__(self, handle):
+        self.handle = handle
+        self.length = os.fstat(handle.fileno()).st_size
+
+    async def seek(self, offset):
+        await asyncio.to_thread(self.handle.seek, offset)
+
+    async def read(self, size):
+        return await asyncio.to_thread(self.handle.read, size)
+
+    async def close(self):
+        await asyncio.to_thread(self.handle.close)
+
+
+class InlineBlobReader(BlobReader):
+    def __init__(self, data: bytes):
+        self.data = data
+        self.length = len(data)
+        self.position = 0
+
+    async def seek(self, offset):
+        self.position = offset
+
+    async def read(self, size):
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    async def close(self):
+        pass
+
+
+class GridFSBlobStore(BlobStore):
+    def __init__(self, db: AsyncIOMotorDatabase, bucket_name: str = "lead_files"):
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=UPLOAD_CHUNK_SIZE)
+
+    async def save(self, blob_id, chunks, filename, content_type):
+        grid_in = self.bucket.open_upload_stream_with_id(
+            blob_id, filename or blob_id, metadata={"content_type": content_type}
+        )
+        try:
+            async for chunk in chunks:
+                await grid_in.write(chunk)
+        except Exception:
+            await grid_in.abort()
+            raise
+        await grid_in.close()
+
+    async def open(self, blob_id):
+        try:
+            grid_out = await self.bucket.open_download_stream(blob_id)
+        except gridfs.errors.NoFile:
+            raise FileNotFoundError(blob_id)
+        return GridFSBlobReader(grid_out)
+
+    async def delete(self, blob_id):
+        try:
+            await self.bucket.delete(blob_id)
+        except gridfs.errors.NoFile:
+            pass
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, blob_id: str) -> Path:
+        return self.root / blob_id
+
+    async def save(self, blob_id, chunks, filename, content_type):
+        partial = self._path(f"{blob_id}.part")
+        handle = await asyncio.to_thread(open, partial, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(handle.write, chunk)
+            await asyncio.to_thread(handle.close)
+            await asyncio.to_thread(os.replace, partial, self._path(blob_id))
+        except Exception:
+            handle.close()
+            partial.unlink(missing_ok=True)
+            raise
+
+    async def open(self, blob_id):
+        handle = await asyncio.to_thread(open, self._path(blob_id), "rb")
+        return LocalBlobReader(handle)
+
+    async def delete(self, blob_id):
+        await asyncio.to_thread(self._path(blob_id).unlink, missing_ok=True)
+
+
+def create_blob_store(db: AsyncIOMotorDatabase) -> BlobStore:
+    if BLOB_STORE == "local":
+        return LocalBlobStore(BLOB_STORE_PATH)
+    if BLOB_STORE == "gridfs":
+        return GridFSBlobStore(db)
+    raise RuntimeError(f"BLOB_STORE inválido: {BLOB_STORE}")
+
+
+def get_blob_store() -> BlobStore:
+    if blob_store is None:
+        raise HTTPException(status_code=500, detail="Armazenamento de arquivos não inicializado")
+    return blob_store
+
+
+def lead_file_type(content_type: Optional[str]) -> Optional[str]:
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    return media_type if media_type in LEAD_FILE_TYPES else None
+
+
+def require_lead_file_type(content_type: Optional[str]) -> str:
+    media_type = lead_file_type(content_type)
+    if media_type is None:
+        UPLOAD_REJECTIONS.labels("type").inc()
+        raise HTTPException(status_code=415, detail="Envie o arquivo em PDF, PNG, JPEG ou WEBP.")
+    return media_type
+
+
+async def store_upload(upload: UploadFile) -> dict:
+    content_type = require_lead_file_type(upload.content_type)
+    store = get_blob_store()
+    blob_id = str(uuid.uuid4())
+    hasher = hashlib.sha256()
+    size = 0
+
+    async def chunks():
+        nonlocal size
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            UPLOAD_BYTES.inc(len(chunk))
+            if size > UPLOAD_MAX_BYTES:
+                UPLOAD_REJECTIONS.labels("too_large").inc()
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Arquivo muito grande (máximo {UPLOAD_MAX_BYTES // (1024 * 1024)} MB).",
+                )
+            hasher.update(chunk)
+            yield chunk
+
+    await store.save(blob_id, chunks(), upload.filename, content_type)
+    return {
+        "id": blob_id,
+        "nome": upload.filename,
+        "tipo": content_type,
+        "tamanho": size,
+        "sha256": hasher.hexdigest(),
+    }
+
+
+# Upload admission control
+# Starlette spools multipart bodies before the handler runs, and /tmp is
+# memory-backed on Cloud Run, so uploads are admitted in ASGI middleware from
+# Content-Length alone: oversized requests get 413 and requests beyond the
+# concurrency or in-flight byte budget get 503 with Retry-After, before any
+# body byte is read.
+class UploadAdmission:
+    def __init__(self, max_concurrent: int, max_inflight_bytes: int):
+        self.max_concurrent = max_concurrent
+        self.max_inflight_bytes = max_inflight_bytes
+        self.active = 0
+        self.inflight_bytes = 0
+
+    def try_acquire(self, size: int) -> bool:
+        if self.active >= self.max_concurrent or self.inflight_bytes + size > self.max_inflight_bytes:
+            return False
+        self.active += 1
+        self.inflight_bytes += size
+        UPLOADS_IN_FLIGHT.set(self.active)
+        UPLOAD_INFLIGHT_BYTES.set(self.inflight_bytes)
+        return True
+
+    def release(self, size: int):
+        self.active -= 1
+        self.inflight_bytes -= size
+        UPLOADS_IN_FLIGHT.set(self.active)
+        UPLOAD_INFLIGHT_BYTES.set(self.inflight_bytes)
+
+
+upload_admission = UploadAdmission(UPLOAD_MAX_CONCURRENT, UPLOAD_MAX_INFLIGHT_BYTES)
+
+
+def upload_request_limit(method: str, path: str) -> Optional[int]:
+    if method == "POST" and path == "/api/leads/form":
+        return len(LEAD_FILE_KINDS) * UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD
+    if method == "PATCH" and path.startswith("/api/uploads/"):
+        return UPLOAD_PART_SIZE
+    return None
+
+
+class UploadAdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limit = upload_request_limit(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        raw_length = dict(scope["headers"]).get(b"content-length", b"")
+        if not raw_length.isdigit():
+            await self._reject(scope, receive, send, "length_required", 411, "Envie o cabeçalho Content-Length.")
+            return
+        size = int(raw_length)
+        if size > limit:
+            detail = f"Arquivos muito grandes (máximo {limit // (1024 * 1024)} MB por envio)."
+            await self._reject(scope, receive, send, "too_large", 413, detail)
+            return
+        if not upload_admission.try_acquire(size):
+            detail = "Muitos envios em andamento. Tente novamente em instantes."
+            await self._reject(scope, receive, send, "busy", 503, detail, {"Retry-After": str(UPLOAD_RETRY_AFTER)})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            upload_admission.release(size)
+
+    async def _reject(self, scope, receive, send, reason: str, status_code: int, detail: str, headers: Optional[dict] = None):
+        UPLOAD_REJECTIONS.labels(reason).inc()
+        # The body is never read, so ask the client not to reuse the connection
+        response = JSONResponse({"detail": detail}, status_code=status_code, headers={"Connection": "close", **(headers or {})})
+        await response(scope, receive, send)
+
+
+def lead_file_fields(kind: str, stored: dict) -> dict:
+    return {
+        f"{kind}_arquivo_id": stored["id"],
+        f"{kind}_arquivo_nome": stored["nome"],
+        f"{kind}_arquivo_tipo": stored["tipo"],
+        f"{kind}_arquivo_tamanho": stored["tamanho"],
+        f"{kind}_arquivo_sha256": stored["sha256"],
+    }
+
+
+# Resumable uploads
+# Clients on flaky connections send each attachment as a series of parts:
+# POST /uploads opens a session, PATCH /uploads/{id} appends one part at the
+# offset the server expects (verified against its Upload-Checksum), GET
+# /uploads/{id} reports the offset to resume from and POST .../complete
+# streams the parts into a single blob. Parts are stored as blobs of their
+# own and copied once more on completion, since BlobStore has no append; the
+# copy is bounded by UPLOAD_MAX_BYTES. Each assembly attempt carries its own
+# token, so a retry after UPLOAD_ASSEMBLY_TIMEOUT can take over from a
+# crashed one without the two overwriting each other. The lead form then
+# references the upload id instead of carrying the file. Sessions are dropped
+# when a lead claims them; expired ones are deleted with their blobs by the
+# sweeper.
+def upload_expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+
+
+def upload_session(upload: dict) -> dict:
+    session = {
+        "id": upload["id"],
+        "kind": upload["kind"],
+        "status": upload["status"],
+        "tamanho": upload["tamanho"],
+        "offset": upload["offset"],
+        "part_size": UPLOAD_PART_SIZE,
+        # Mongo hands datetimes back naive, in UTC
+        "expires_at": upload["expires_at"].replace(tzinfo=timezone.utc).isoformat(),
+    }
+    if upload.get("blob"):
+        session["sha256"] = upload["blob"]["sha256"]
+    return session
+
+
+def upload_offset_error(status_code: int, detail: str, offset: int) -> HTTPException:
+    return HTTPException(status_code=status_code, detail=detail, headers={"Upload-Offset": str(offset)})
+
+
+def parse_upload_checksum(value: Optional[str]) -> bytes:
+    # "sha256 <base64 digest>", as in the tus checksum extension
+    algorithm, _, encoded = (value or "").strip().partition(" ")
+    try:
+        digest = base64.b64decode(encoded.strip(), validate=True)
+    except ValueError:
+        digest = b""
+    if algorithm.lower() != "sha256" or len(digest) != 32:
+        raise HTTPException(status_code=400, detail="Envie o cabeçalho Upload-Checksum (sha256).")
+    return digest
+
+
+async def read_upload_part(request: Request, limit: int) -> bytes:
+    part = bytearray()
+    async for chunk in request.stream():
+        part += chunk
+        if len(part) > limit:
+            UPLOAD_REJECTIONS.labels("too_large").inc()
+            raise HTTPException(status_code=413, detail="Parte maior que o permitido para este upload.")
+    return bytes(part)
+
+
+async def single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def concatenated_blobs(store: BlobStore, blob_ids: List[str], hasher) -> AsyncIterator[bytes]:
+    for blob_id in blob_ids:
+        reader = await store.open(blob_id)
+        try:
+            while True:
+                chunk = await reader.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                yield chunk
+        finally:
+            await reader.close()
+
+
+async def find_upload(db: AsyncIOMotorDatabase, upload_id: str) -> dict:
+    upload = await db.uploads.find_one(
+        {"id": upload_id, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"_id": 0}
+    )
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload não encontrado ou expirado.")
+    return upload
+
+
+async def claim_upload(db: AsyncIOMotorDatabase, upload_id: str, kind: str) -> dict:
+    # The lead takes over the assembled blob and the session goes away
+    upload = await db.uploads.find_one_and_delete(
+        {"id": upload_id, "kind": kind, "status": "complete", "expires_at": {"$gt": datetime.now(timezone.utc)}},
+        projection={"_id": 0, "blob": 1},
+    )
+    if upload is None:
+        raise HTTPException(status_code=400, detail="Upload não encontrado ou expirado. Envie o arquivo novamente.")
+    return upload["blob"]
+
+
+class UploadSweeper:
+    def __init__(self, interval: int):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self, db: AsyncIOMotorDatabase):
+        while True:
+            try:
+                removed = await self.run_once(db)
+                if removed:
+                    logger.info("Removed %d expired uploads", removed)
+            except PyMongoError as exc:
+                logger.warning("Upload sweep failed: %s", exc)
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, db: AsyncIOMotorDatabase) -> int:
+        # Blobs go first so a sweep interrupted halfway is simply repeated; an
+        # expired session can no longer gain parts, and deletes are idempotent
+        store = get_blob_store()
+        expired = {"expires_at": {"$lte": datetime.now(timezone.utc)}}
+        removed = 0
+        async for upload in db.uploads.find(expired, {"_id": 0, "id": 1, "parts": 1, "blob": 1}):
+            for part_id in upload.get("parts", []):
+                await store.delete(part_id)
+            if upload.get("blob"):
+                await store.delete(upload["blob"]["id"])
+            result = await db.uploads.delete_one({"id": upload["id"], **expired})
+            removed += result.deleted_count
+        UPLOAD_SESSIONS_EXPIRED.inc(removed)
+        return removed
+
+
+upload_sweeper = UploadSweeper(UPLOAD_SWEEP_INTERVAL)
+
 # JWT helpers
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -251,24 +1904,479 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+class VerifiedToken(NamedTuple):
+    username: str
+    version: int
+    expires_at: float
+
+
+# Decoded claims keyed by token digest, kept until the token's own `exp`
+verified_tokens: "OrderedDict[bytes, VerifiedToken]" = OrderedDict()
+# username -> (fetched_at, token_version); -1 marks a missing admin
+admin_token_versions: dict = {}
+
+
+def _cache_verified_token(key: bytes, claims: VerifiedToken):
+    verified_tokens[key] = claims
+    verified_tokens.move_to_end(key)
+    while len(verified_tokens) > TOKEN_CACHE_SIZE:
+        verified_tokens.popitem(last=False)
+
+
+async def get_admin_token_version(username: str) -> int:
+    cached = admin_token_versions.get(username)
+    now = time.monotonic()
+    if cached and now - cached[0] < TOKEN_VERSION_TTL:
+        return cached[1]
+    admin = await get_db().admins.find_one({"username": username}, {"_id": 0, "token_version": 1})
+    version = admin.get("token_version", 0) if admin is not None else -1
+    admin_token_versions[username] = (now, version)
+    return version
+
+
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    return await verify_token_value(credentials.credentials)
+
+
+async def verify_token_value(token: str) -> str:
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    claims = verified_tokens.get(key)
+    if claims is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Token inválido ou expirado")
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Token inválido")
-        return username
-    except JWTError:
+        claims = VerifiedToken(username, payload.get("ver", 0), float(payload["exp"]))
+        _cache_verified_token(key, claims)
+    elif claims.expires_at <= time.time():
+        verified_tokens.pop(key, None)
         raise HTTPException(status_code=401, detail="Token inválido ou expirado")
+    else:
+        verified_tokens.move_to_end(key)
+
+    if await get_admin_token_version(claims.username) != claims.version:
+        raise HTTPException(status_code=401, detail="Token inválido ou expirado")
+    return claims.username
 
 # Rate limiting
-def check_rate_limit(ip: str):
-    now = time.time()
-    rate_limit_store[ip] = [t for t in rate_limit_store[ip] if now - t < RATE_LIMIT_WINDOW]
-    if len(rate_limit_store[ip]) >= RATE_LIMIT_MAX:
+# Sliding-window counter: the previous fixed window's count is weighted by how
+# much of it still overlaps the sliding window, so each check is O(1) and each
+# key needs two counters instead of a list of timestamps.
+def sliding_window_estimate(previous: int, current: int, now: float, window: int) -> float:
+    elapsed = (now % window) / window
+    return previous * (1 - elapsed) + current
+
+
+class RateLimiter(ABC):
+    def __init__(self, limit: int, window: int):
+        self.limit = limit
+        self.window = window
+
+    @abstractmethod
+    async def hit(self, key: str) -> bool:
+        ...
+
+
+class MemoryRateLimiter(RateLimiter):
+    def __init__(self, limit: int, window: int, max_keys: int):
+        super().__init__(limit, window)
+        self.max_keys = max_keys
+        # key -> [window index, previous count, current count], least recently hit first
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def _evict(self, window_index: int):
+        while self.buckets:
+            key, bucket = next(iter(self.buckets.items()))
+            if bucket[0] >= window_index - 1 and len(self.buckets) <= self.max_keys:
+                break
+            self.buckets.popitem(last=False)
+
+    async def hit(self, key: str) -> bool:
+        now = time.time()
+        window_index = int(now // self.window)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [window_index, 0, 0]
+        elif bucket[0] != window_index:
+            previous = bucket[2] if bucket[0] == window_index - 1 else 0
+            bucket[:] = [window_index, previous, 0]
+        self.buckets.move_to_end(key)
+        self._evict(window_index)
+
+        if sliding_window_estimate(bucket[1], bucket[2], now, self.window) >= self.limit:
+            return False
+        bucket[2] += 1
+        return True
+
+
+class MongoRateLimiter(RateLimiter):
+    # One document per (key, window) with a TTL index on expires_at, shared by
+    # every instance; counters only move through atomic $inc.
+    def __init__(self, db: AsyncIOMotorDatabase, limit: int, window: int, fallback: RateLimiter):
+        super().__init__(limit, window)
+        self.collection = db.rate_limits
+        self.fallback = fallback
+
+    async def hit(self, key: str) -> bool:
+        now = time.time()
+        window_index = int(now // self.window)
+        current_id = f"{key}:{window_index}"
+        expires_at = datetime.fromtimestamp((window_index + 2) * self.window, timezone.utc)
+        try:
+            current, previous = await asyncio.gather(
+                self.collection.find_one_and_update(
+                    {"_id": current_id},
+                    {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": expires_at}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                ),
+                self.collection.find_one({"_id": f"{key}:{window_index - 1}"}),
+            )
+            previous_count = previous["count"] if previous else 0
+            if sliding_window_estimate(previous_count, current["count"] - 1, now, self.window) >= self.limit:
+                # Rejected requests do not consume quota
+                await self.collection.update_one({"_id": current_id}, {"$inc": {"count": -1}})
+                return False
+            return True
+        except PyMongoError as exc:
+            logger.warning("Shared rate limiter unavailable, using local limits: %s", exc)
+            return await self.fallback.hit(key)
+
+
+rate_limiter: RateLimiter = MemoryRateLimiter(RATE_LIMIT_MAX, RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_KEYS)
+
+
+def create_rate_limiter(db: AsyncIOMotorDatabase) -> RateLimiter:
+    memory = MemoryRateLimiter(RATE_LIMIT_MAX, RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_KEYS)
+    if RATE_LIMIT_BACKEND == "memory":
+        return memory
+    if RATE_LIMIT_BACKEND == "mongo":
+        return MongoRateLimiter(db, RATE_LIMIT_MAX, RATE_LIMIT_WINDOW, memory)
+    raise RuntimeError(f"RATE_LIMIT_BACKEND inválido: {RATE_LIMIT_BACKEND}")
+
+
+def get_client_ip(request: Request) -> str:
+    peer = request.client.host if request.client else ""
+    if TRUSTED_PROXY_HOPS <= 0:
+        return peer
+    forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    # Entries left of the ones our proxies appended are client-controlled
+    if len(forwarded) >= TRUSTED_PROXY_HOPS:
+        return forwarded[-TRUSTED_PROXY_HOPS]
+    return forwarded[0] if forwarded else peer
+
+
+async def check_rate_limit(ip: str) -> bool:
+    allowed = await rate_limiter.hit(ip)
+    if not allowed:
+        RATE_LIMIT_REJECTIONS.inc()
+    return allowed
+
+# Lead ingestion
+# In batch mode, inserts arriving within LEAD_BATCH_WINDOW_MS of each other (or
+# until LEAD_BATCH_MAX_SIZE documents) share one unordered insert_many, so a
+# campaign burst pays one write-concern round trip per batch instead of per
+# lead. Each caller still waits for its own document to be acknowledged and
+# gets its own write error back.
+class InsertBatcher:
+    def __init__(self, window: float, max_size: int, write: Callable[[AsyncIOMotorDatabase, list], Awaitable[dict]]):
+        # write(db, documents) returns {index: exception} for the documents it could not store
+        self.window = window
+        self.max_size = max_size
+        self.write = write
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.pending: list = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.writes: set = set()
+
+    async def insert(self, db: AsyncIOMotorDatabase, document: dict):
+        loop = asyncio.get_running_loop()
+        if not self.pending:
+            self.db = db
+            self.timer = loop.call_later(self.window, self._flush)
+        future = loop.create_future()
+        self.pending.append((document, future))
+        if len(self.pending) >= self.max_size:
+            self._flush()
+        await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        entries, self.pending = self.pending, []
+        if entries:
+            task = asyncio.create_task(self._write(self.db, entries))
+            self.writes.add(task)
+            task.add_done_callback(self.writes.discard)
+
+    async def _write(self, db: AsyncIOMotorDatabase, entries: list):
+        LEAD_BATCH_SIZE.observe(len(entries))
+        try:
+            failures = await self.write(db, [document for document, _ in entries])
+        except Exception as exc:
+            failures = {index: exc for index in range(len(entries))}
+
+        for index, (_, future) in enumerate(entries):
+            # Callers that went away (client disconnect) leave a cancelled future
+            if future.done():
+                continue
+            if index in failures:
+                future.set_exception(failures[index])
+            else:
+                future.set_result(None)
+
+    async def drain(self):
+        self._flush()
+        if self.writes:
+            await asyncio.gather(*self.writes, return_exceptions=True)
+
+
+def bulk_write_failures(exc: BulkWriteError, count: int) -> dict:
+    failures = {}
+    for error in exc.details.get("writeErrors", []):
+        error_class = DuplicateKeyError if error.get("code") == 11000 else WriteError
+        failures[error["index"]] = error_class(error.get("errmsg"), error.get("code"), error)
+    if exc.details.get("writeConcernErrors"):
+        # Nothing in the batch is known to be durable
+        failures = {index: failures.get(index, exc) for index in range(count)}
+    return failures
+
+
+async def write_leads(db: AsyncIOMotorDatabase, documents: List[dict]) -> dict:
+    # Leads and their outbox entries commit together, so a notification exists
+    # exactly when its lead does
+    if not outbox_sinks:
+        try:
+            await db.leads.insert_many(documents, ordered=False)
+            return {}
+        except BulkWriteError as exc:
+            return bulk_write_failures(exc, len(documents))
+
+    in_transaction = False
+
+    async def write(session=None):
+        nonlocal in_transaction
+        in_transaction = session is not None
+        failed = set()
+        try:
+            await db.leads.insert_many(documents, ordered=False, session=session)
+        except BulkWriteError as exc:
+            if in_transaction:
+                raise
+            failed = set(bulk_write_failures(exc, len(documents)))
+            error = exc
+        entries = [entry for index, lead in enumerate(documents) if index not in failed for entry in outbox_entries(lead)]
+        if entries:
+            await db.outbox.insert_many(entries, ordered=False, session=session)
+        if failed:
+            raise error
+
+    try:
+        await run_transaction(db, write)
+        return {}
+    except BulkWriteError as exc:
+        if not in_transaction or len(documents) == 1:
+            return bulk_write_failures(exc, len(documents))
+    # One bad document aborted the whole transaction; retry one by one to
+    # find it without failing the rest of the batch
+    failures = {}
+    for index, document in enumerate(documents):
+        failure = await write_leads(db, [document])
+        if failure:
+            failures[index] = failure[0]
+    return failures
+
+
+lead_batcher = InsertBatcher(LEAD_BATCH_WINDOW_MS / 1000, LEAD_BATCH_MAX_SIZE, write_leads)
+
+
+async def insert_lead(db: AsyncIOMotorDatabase, document: dict):
+    if LEAD_INGEST_MODE == "batch":
+        await lead_batcher.insert(db, document)
+    else:
+        failures = await write_leads(db, [document])
+        if failures:
+            raise failures[0]
+    outbox_worker.wake()
+
+
+def normalize_phone(value: Optional[str]) -> Optional[str]:
+    # E.164; numbers without a country code are taken as Brazilian (DDD + number)
+    value = (value or "").strip()
+    digits = re.sub(r"\D", "", value)
+    if value.startswith("+"):
+        return f"+{digits}" if 8 <= len(digits) <= 15 else None
+    digits = digits.lstrip("0")
+    if len(digits) in (10, 11):
+        return f"+{LEAD_PHONE_COUNTRY_CODE}{digits}"
+    if digits.startswith(LEAD_PHONE_COUNTRY_CODE) and len(digits) in (12, 13):
+        return f"+{digits}"
+    return None
+
+
+def normalize_email(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip().lower()
+    return value if "@" in value else None
+
+
+def lead_fingerprints(telefone: Optional[str], email: Optional[str]) -> dict:
+    return {"telefone_e164": normalize_phone(telefone), "email_normalizado": normalize_email(email)}
+
+
+# Lead statistics rollup
+# lead_stats holds one counter per (dimension, value) bucket, kept current with
+# $inc on every lead write, so the dashboard reads O(buckets) documents. Counter
+# updates are not transactional with the lead write; rebuild_lead_stats
+# recomputes every bucket from the leads collection if they ever drift.
+LEAD_STATS_DIMENSIONS = ("status", "plano", "cidade", "concessionaria")
+
+
+def lead_stat_buckets(lead: dict) -> List[Tuple[str, object]]:
+    buckets = [("total", "")]
+    buckets.extend((field, lead.get(field) or "") for field in LEAD_STATS_DIMENSIONS)
+    buckets.append(("plano_status", {"plano": lead.get("plano") or "", "status": lead.get("status") or ""}))
+    created_at = lead.get("created_at")
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    day = created_at[:10] if isinstance(created_at, str) else ""
+    try:
+        year, week, _ = datetime.strptime(day, "%Y-%m-%d").isocalendar()
+    except ValueError:
+        # Legacy or malformed created_at: still counted, just not by day/week
+        return buckets
+    buckets.append(("dia", day))
+    buckets.append(("semana", f"{year}-W{week:02d}"))
+    return buckets
+
+
+def lead_stat_key(dimension: str, value) -> str:
+    return json.dumps([dimension, value], ensure_ascii=False, separators=(",", ":"))
+
+
+async def apply_lead_stats(db: AsyncIOMotorDatabase, removed: Optional[dict], added: Optional[dict]):
+    deltas = {}
+    for lead, amount in ((removed, -1), (added, 1)):
+        for dimension, value in lead_stat_buckets(lead) if lead else []:
+            key = lead_stat_key(dimension, value)
+            delta = deltas.setdefault(key, [dimension, value, 0])
+            delta[2] += amount
+
+    operations = [
+        UpdateOne(
+            {"_id": key},
+            {"$inc": {"count": amount}, "$setOnInsert": {"dimension": dimension, "value": value}},
+            upsert=True,
+        )
+        for key, (dimension, value, amount) in deltas.items()
+        if amount
+    ]
+    if not operations:
+        return
+    try:
+        await db.lead_stats.bulk_write(operations, ordered=False)
+    except PyMongoError as exc:
+        # The lead itself is saved; a rebuild brings the counters back in line
+        logger.warning("Lead stats update failed, rollup may drift: %s", exc)
+
+
+async def rebuild_lead_stats(db: AsyncIOMotorDatabase) -> int:
+    # One pass grouping by every bucketed field; the groups are expanded into
+    # buckets with the same function the incremental path uses
+    group_id = {field: f"${field}" for field in LEAD_STATS_DIMENSIONS}
+    # Code points, not bytes, so a malformed value with accents cannot split a
+    # character; legacy BSON dates are formatted the same way as the strings
+    created_at_type = {"$type": "$created_at"}
+    group_id["created_at"] = {
+        "$switch": {
+            "branches": [
+                {
+                    "case": {"$eq": [created_at_type, "string"]},
+                    "then": {"$substrCP": ["$created_at", 0, 10]},
+                },
+                {
+                    "case": {"$eq": [created_at_type, "date"]},
+                    "then": {"$dateToString": {"date": "$created_at", "format": "%Y-%m-%d"}},
+                },
+            ],
+            "default": "",
+        }
+    }
+    counts = {}
+    async for group in db.leads.aggregate([{"$group": {"_id": group_id, "count": {"$sum": 1}}}]):
+        for dimension, value in lead_stat_buckets(group["_id"]):
+            key = lead_stat_key(dimension, value)
+            bucket = counts.setdefault(key, {"dimension": dimension, "value": value, "count": 0})
+            bucket["count"] += group["count"]
+
+    if counts:
+        await db.lead_stats.bulk_write(
+            [ReplaceOne({"_id": key}, bucket, upsert=True) for key, bucket in counts.items()], ordered=False
+        )
+    await db.lead_stats.delete_many({"_id": {"$nin": list(counts)}})
+    return len(counts)
+
+
+async def merge_duplicate_lead(db: AsyncIOMotorDatabase, fingerprints: dict, submission: dict) -> Optional[dict]:
+    # Each $or branch is an equality + range seek on its own partial index
+    clauses = [{field: value} for field, value in fingerprints.items() if value]
+    if LEAD_DEDUP_WINDOW_HOURS <= 0 or not clauses:
+        return None
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(hours=LEAD_DEDUP_WINDOW_HOURS)).isoformat()
+    lead = await db.leads.find_one_and_update(
+        {"$or": clauses, "created_at": {"$gte": cutoff}},
+        {"$inc": {"submissions": 1}, "$set": {"last_submitted_at": now.isoformat(), "updated_at": now.isoformat()}},
+        # The history stays out of what the public form gets back
+        projection={**LEAD_BLOB_PROJECTION, "resubmissions": 0},
+        sort=[("created_at", DESCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+    if lead is None:
+        return None
+
+    # Answers the lead was missing are filled in; ones that changed are kept
+    # in its resubmission history
+    changed = {field: value for field, value in submission.items() if value not in (None, "") and value != lead.get(field)}
+    filled = {field: value for field, value in changed.items() if lead.get(field) in (None, "")}
+    differing = {field: value for field, value in changed.items() if field not in filled}
+    operations = [
+        UpdateOne({"id": lead["id"], field: {"$in": [None, ""]}}, {"$set": {field: value}})
+        for field, value in filled.items()
+    ]
+    if differing:
+        entry = {"submitted_at": now.isoformat(), **differing}
+        operations.append(
+            UpdateOne(
+                {"id": lead["id"]},
+                {"$push": {"resubmissions": {"$each": [entry], "$slice": -LEAD_RESUBMISSIONS_KEPT}}},
+            )
+        )
+    if operations:
+        await db.leads.bulk_write(operations, ordered=False)
+    if filled:
+        await apply_lead_stats(db, lead, {**lead, **filled})
+        lead.update(filled)
+    return lead
+
+
+async def attach_missing_lead_file(db: AsyncIOMotorDatabase, lead: dict, kind: str, stored: dict) -> bool:
+    # A merged resubmission's attachment is kept only where the lead has none
+    fields = lead_file_fields(kind, stored)
+    result = await db.leads.update_one(
+        {
+            "id": lead["id"],
+            f"{kind}_arquivo_id": {"$in": [None, ""]},
+            f"{kind}_arquivo_base64": {"$in": [None, ""]},
+        },
+        {"$set": fields},
+    )
+    if result.modified_count == 0:
         return False
-    rate_limit_store[ip].append(now)
+    lead.update(fields)
     return True
 
 # Routes
@@ -282,70 +2390,97 @@ async def root():
 async def login(data: AdminLogin):
     db = get_db()
     admin = await db.admins.find_one({"username": data.username})
-    if not admin or not pwd_context.verify(data.password, admin["password_hash"]):
+    if not admin:
+        raise HTTPException(status_code=401, detail="Credenciais inválidas")
+    valid, new_hash = await password_hasher.verify_and_update(data.password, admin["password_hash"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
-    access_token = create_access_token(data={"sub": data.username})
+    if new_hash:
+        await db.admins.update_one(
+            {"username": data.username, "password_hash": admin["password_hash"]},
+            {"$set": {"password_hash": new_hash}},
+        )
+    access_token = create_access_token(data={"sub": data.username, "ver": admin.get("token_version", 0)})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @api_router.get("/auth/me")
 async def get_me(username: str = Depends(verify_token)):
     return {"username": username}
 
+@api_router.get("/admin/auth/stats")
+async def get_password_hash_stats(username: str = Depends(verify_token)):
+    return password_hasher.stats()
+
 @api_router.post("/auth/change-password")
 async def change_password(data: AdminLogin, username: str = Depends(verify_token)):
     db = get_db()
-    password_hash = pwd_context.hash(data.password)
-    await db.admins.update_one({"username": username}, {"$set": {"password_hash": password_hash}})
-    return {"message": "Senha alterada com sucesso"}
+    password_hash = await password_hasher.hash(data.password)
+    # Bumping token_version revokes every session issued before this change
+    admin = await db.admins.find_one_and_update(
+        {"username": username},
+        {"$set": {"password_hash": password_hash}, "$inc": {"token_version": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not admin:
+        raise HTTPException(status_code=401, detail="Token inválido ou expirado")
+    admin_token_versions[username] = (time.monotonic(), admin["token_version"])
+    access_token = create_access_token(data={"sub": username, "ver": admin["token_version"]})
+    return {"message": "Senha alterada com sucesso", "access_token": access_token, "token_type": "bearer"}
 
 # Public content route
 @api_router.get("/content")
-async def get_all_content():
-    db = get_db()
-    content = {}
-    async for row in db.content.find({}, {"_id": 0, "key": 1, "value": 1}):
-        content[row["key"]] = row["value"]
-    return content
+async def get_all_content(request: Request):
+    snapshot = await site_cache.get(get_db())
+    return encoded_json_response(request, snapshot.bodies["content"])
 
 # Public plans route
 @api_router.get("/plans", response_model=List[PlanResponse])
-async def get_plans():
-    db = get_db()
-    plans = []
-    async for row in db.plans.find({}, {"_id": 0}).sort("ordem", ASCENDING):
-        plans.append(row)
-    return plans
+async def get_plans(request: Request):
+    snapshot = await site_cache.get(get_db())
+    return encoded_json_response(request, snapshot.bodies["plans"])
+
+# Public landing-page bootstrap (content + plans in one round trip)
+@api_router.get("/bootstrap")
+async def get_bootstrap(request: Request):
+    snapshot = await site_cache.get(get_db())
+    return encoded_json_response(request, snapshot.bodies["bootstrap"])
 
 # Lead creation (public with rate limit)
 @api_router.post("/leads", response_model=LeadResponse)
 async def create_lead(lead: LeadCreate, request: Request):
-    client_ip = request.client.host
-    if not check_rate_limit(client_ip):
+    if not await check_rate_limit(get_client_ip(request)):
         raise HTTPException(status_code=429, detail="Muitas requisições. Tente novamente em 1 minuto.")
     
     # Honeypot check
     if lead.honeypot:
         raise HTTPException(status_code=400, detail="Requisição inválida")
     
+    db = get_db()
+    fingerprints = lead_fingerprints(lead.telefone, None)
+    duplicate = await merge_duplicate_lead(db, fingerprints, lead.model_dump(exclude={"honeypot", "telefone"}))
+    if duplicate is not None:
+        return duplicate
+
     lead_id = str(uuid.uuid4())
     created_at = datetime.now(timezone.utc).isoformat()
     
-    db = get_db()
-    await db.leads.insert_one(
-        {
-            "id": lead_id,
-            "nome": lead.nome,
-            "empresa": lead.empresa,
-            "telefone": lead.telefone,
-            "cidade": lead.cidade,
-            "plano": lead.plano,
-            "potencia": lead.potencia,
-            "concessionaria": lead.concessionaria,
-            "observacoes": lead.observacoes,
-            "status": "novo",
-            "created_at": created_at,
-        }
-    )
+    lead_doc = {
+        "id": lead_id,
+        "nome": lead.nome,
+        "empresa": lead.empresa,
+        "telefone": lead.telefone,
+        "cidade": lead.cidade,
+        "plano": lead.plano,
+        "potencia": lead.potencia,
+        "concessionaria": lead.concessionaria,
+        "observacoes": lead.observacoes,
+        **fingerprints,
+        "submissions": 1,
+        "status": "novo",
+        "created_at": created_at,
+    }
+    await insert_lead(db, lead_doc)
+    await apply_lead_stats(db, None, lead_doc)
     
     return {
         "id": lead_id,
@@ -357,6 +2492,7 @@ async def create_lead(lead: LeadCreate, request: Request):
         "potencia": lead.potencia,
         "concessionaria": lead.concessionaria,
         "observacoes": lead.observacoes,
+        "submissions": 1,
         "status": "novo",
         "created_at": created_at
     }
@@ -367,28 +2503,43 @@ async def create_tasting_lead(
     request: Request,
     nome: str = Form(...),
     email: str = Form(...),
-    conta_luz_arquivo: UploadFile = File(...),
-    monitoramento_arquivo: UploadFile = File(...),
+    conta_luz_arquivo: Optional[UploadFile] = File(None),
+    monitoramento_arquivo: Optional[UploadFile] = File(None),
+    conta_luz_upload_id: Optional[str] = Form(None),
+    monitoramento_upload_id: Optional[str] = Form(None),
 ):
-    client_ip = request.client.host
-    if not check_rate_limit(client_ip):
+    if not await check_rate_limit(get_client_ip(request)):
         raise HTTPException(status_code=429, detail="Muitas requisições. Tente novamente em 1 minuto.")
 
-    conta_luz_bytes = await conta_luz_arquivo.read()
-    monitoramento_bytes = await monitoramento_arquivo.read()
-
-    if not conta_luz_bytes or not monitoramento_bytes:
-        raise HTTPException(status_code=400, detail="Envie os dois arquivos obrigatórios.")
-
-    lead_id = str(uuid.uuid4())
-    created_at = datetime.now(timezone.utc).isoformat()
-
-    conta_luz_base64 = base64.b64encode(conta_luz_bytes).decode("utf-8")
-    monitoramento_base64 = base64.b64encode(monitoramento_bytes).decode("utf-8")
-
     db = get_db()
-    await db.leads.insert_one(
-        {
+    store = get_blob_store()
+    files = {"conta_luz": conta_luz_arquivo, "monitoramento": monitoramento_arquivo}
+    upload_ids = {"conta_luz": conta_luz_upload_id, "monitoramento": monitoramento_upload_id}
+    stored_files = {}
+    try:
+        for kind in LEAD_FILE_KINDS:
+            if upload_ids[kind]:
+                stored_files[kind] = await claim_upload(db, upload_ids[kind], kind)
+            elif files[kind] is not None:
+                stored_files[kind] = await store_upload(files[kind])
+            else:
+                raise HTTPException(status_code=400, detail="Envie os dois arquivos obrigatórios.")
+        if any(stored["tamanho"] == 0 for stored in stored_files.values()):
+            raise HTTPException(status_code=400, detail="Envie os dois arquivos obrigatórios.")
+
+        fingerprints = lead_fingerprints(None, email)
+        duplicate = await merge_duplicate_lead(db, fingerprints, {"nome": nome, "email": email})
+        if duplicate is not None:
+            # Attachments the earlier submission already has are kept
+            for kind, stored in list(stored_files.items()):
+                if not await attach_missing_lead_file(db, duplicate, kind, stored):
+                    await store.delete(stored["id"])
+                del stored_files[kind]
+            return duplicate
+
+        lead_id = str(uuid.uuid4())
+        created_at = datetime.now(timezone.utc).isoformat()
+        lead_doc = {
             "id": lead_id,
             "nome": nome,
             "email": email,
@@ -399,50 +2550,190 @@ async def create_tasting_lead(
             "potencia": None,
             "concessionaria": None,
             "observacoes": None,
-            "conta_luz_arquivo_nome": conta_luz_arquivo.filename,
-            "conta_luz_arquivo_tipo": conta_luz_arquivo.content_type,
-            "conta_luz_arquivo_base64": conta_luz_base64,
-            "monitoramento_arquivo_nome": monitoramento_arquivo.filename,
-            "monitoramento_arquivo_tipo": monitoramento_arquivo.content_type,
-            "monitoramento_arquivo_base64": monitoramento_base64,
+            **lead_file_fields("conta_luz", stored_files["conta_luz"]),
+            **lead_file_fields("monitoramento", stored_files["monitoramento"]),
+            **fingerprints,
+            "submissions": 1,
             "status": "novo",
             "created_at": created_at,
         }
+
+        await insert_lead(db, dict(lead_doc))
+    except Exception:
+        for stored in stored_files.values():
+            await store.delete(stored["id"])
+        raise
+
+    await apply_lead_stats(db, None, lead_doc)
+    return lead_doc
+
+
+@api_router.post("/uploads")
+async def create_upload(upload: UploadCreate, request: Request):
+    # Counted apart from lead submissions, since one form opens two uploads
+    if not await check_rate_limit(f"upload:{get_client_ip(request)}"):
+        raise HTTPException(status_code=429, detail="Muitas requisições. Tente novamente em 1 minuto.")
+    if upload.kind not in LEAD_FILE_KINDS:
+        raise HTTPException(status_code=400, detail="Tipo de arquivo inválido")
+    content_type = require_lead_file_type(upload.tipo)
+    if upload.tamanho <= 0:
+        raise HTTPException(status_code=400, detail="Envie os dois arquivos obrigatórios.")
+    if upload.tamanho > UPLOAD_MAX_BYTES:
+        UPLOAD_REJECTIONS.labels("too_large").inc()
+        raise HTTPException(
+            status_code=413,
+            detail=f"Arquivo muito grande (máximo {UPLOAD_MAX_BYTES // (1024 * 1024)} MB).",
+        )
+
+    document = {
+        "id": str(uuid.uuid4()),
+        "kind": upload.kind,
+        "nome": upload.nome,
+        "tipo": content_type,
+        "tamanho": upload.tamanho,
+        "offset": 0,
+        "parts": [],
+        "status": "open",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "expires_at": upload_expiry(),
+    }
+    await get_db().uploads.insert_one(dict(document))
+    return upload_session(document)
+
+
+@api_router.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    upload = await find_upload(get_db(), upload_id)
+    return JSONResponse(
+        upload_session(upload), headers={"Upload-Offset": str(upload["offset"]), "Cache-Control": "no-store"}
     )
 
-    return {
-        "id": lead_id,
-        "nome": nome,
-        "email": email,
-        "empresa": "",
-        "telefone": "",
-        "cidade": "",
-        "plano": "Degustação gratuita",
-        "potencia": None,
-        "concessionaria": None,
-        "observacoes": None,
-        "conta_luz_arquivo_nome": conta_luz_arquivo.filename,
-        "conta_luz_arquivo_tipo": conta_luz_arquivo.content_type,
-        "conta_luz_arquivo_base64": conta_luz_base64,
-        "monitoramento_arquivo_nome": monitoramento_arquivo.filename,
-        "monitoramento_arquivo_tipo": monitoramento_arquivo.content_type,
-        "monitoramento_arquivo_base64": monitoramento_base64,
-        "status": "novo",
-        "created_at": created_at,
+
+@api_router.patch("/uploads/{upload_id}", status_code=204)
+async def append_upload_part(upload_id: str, request: Request):
+    db = get_db()
+    upload = await find_upload(db, upload_id)
+    offset = upload["offset"]
+    if upload["status"] != "open":
+        raise upload_offset_error(409, "Upload já finalizado.", offset)
+    raw_offset = request.headers.get("upload-offset", "")
+    if not raw_offset.isdigit():
+        raise HTTPException(status_code=400, detail="Envie o cabeçalho Upload-Offset.")
+    if int(raw_offset) != offset:
+        raise upload_offset_error(409, "Offset diferente do recebido pelo servidor.", offset)
+    digest = parse_upload_checksum(request.headers.get("upload-checksum"))
+
+    part = await read_upload_part(request, min(UPLOAD_PART_SIZE, upload["tamanho"] - offset))
+    if not part:
+        raise HTTPException(status_code=400, detail="Parte vazia.")
+    UPLOAD_BYTES.inc(len(part))
+    if hashlib.sha256(part).digest() != digest:
+        UPLOAD_REJECTIONS.labels("checksum").inc()
+        # 460 is tus' Checksum Mismatch; the client resends the same part
+        raise upload_offset_error(460, "Checksum da parte não confere.", offset)
+
+    store = get_blob_store()
+    part_id = f"{upload_id}.{uuid.uuid4().hex}"
+    await store.save(part_id, single_chunk(part), upload["nome"], upload["tipo"])
+    result = await db.uploads.update_one(
+        {"id": upload_id, "status": "open", "offset": offset, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+        {"$set": {"offset": offset + len(part), "expires_at": upload_expiry()}, "$push": {"parts": part_id}},
+    )
+    if result.modified_count == 0:
+        # A retry of the same part got there first
+        await store.delete(part_id)
+        current = await find_upload(db, upload_id)
+        raise upload_offset_error(409, "Offset diferente do recebido pelo servidor.", current["offset"])
+    return Response(status_code=204, headers={"Upload-Offset": str(offset + len(part))})
+
+
+@api_router.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    db = get_db()
+    upload = await find_upload(db, upload_id)
+    if upload["status"] == "complete":
+        # Retried after a lost response
+        return upload_session(upload)
+    if upload["offset"] < upload["tamanho"]:
+        raise upload_offset_error(409, "Upload incompleto.", upload["offset"])
+    now = datetime.now(timezone.utc)
+    assembly = str(uuid.uuid4())
+    claimed = await db.uploads.update_one(
+        {
+            "id": upload_id,
+            "$or": [
+                {"status": "open"},
+                {"status": "assembling", "assembling_at": {"$lt": now - timedelta(seconds=UPLOAD_ASSEMBLY_TIMEOUT)}},
+            ],
+        },
+        {"$set": {"status": "assembling", "assembly": assembly, "assembling_at": now}},
+    )
+    if claimed.modified_count == 0:
+        raise upload_offset_error(409, "Upload em finalização. Tente novamente em instantes.", upload["offset"])
+
+    store = get_blob_store()
+    blob_id = str(uuid.uuid4())
+    hasher = hashlib.sha256()
+    try:
+        await store.save(blob_id, concatenated_blobs(store, upload["parts"], hasher), upload["nome"], upload["tipo"])
+    except Exception:
+        await db.uploads.update_one({"id": upload_id, "assembly": assembly}, {"$set": {"status": "open"}})
+        raise
+
+    upload["blob"] = {
+        "id": blob_id,
+        "nome": upload["nome"],
+        "tipo": upload["tipo"],
+        "tamanho": upload["tamanho"],
+        "sha256": hasher.hexdigest(),
     }
+    upload["status"] = "complete"
+    upload["expires_at"] = upload_expiry()
+    finished = await db.uploads.update_one(
+        {"id": upload_id, "status": "assembling", "assembly": assembly},
+        {"$set": {"status": "complete", "blob": upload["blob"], "expires_at": upload["expires_at"], "parts": []}},
+    )
+    if finished.modified_count == 0:
+        # A retry took over while this assembly was stalled
+        await store.delete(blob_id)
+        raise upload_offset_error(409, "Upload em finalização. Tente novamente em instantes.", upload["offset"])
+    for part_id in upload["parts"]:
+        await store.delete(part_id)
+    return upload_session(upload)
 
 # Admin routes
 
-@api_router.get("/admin/leads", response_model=List[LeadResponse])
-async def get_leads(
+def lead_phone_prefix(q: str) -> Optional[str]:
+    # A search made only of phone characters is matched against telefone_e164
+    # by prefix; text search only matches whole words, never part of a number
+    value = q.strip()
+    if not re.fullmatch(r"[\d\s().+-]+", value):
+        return None
+    digits = re.sub(r"\D", "", value)
+    if len(digits) < 4:
+        return None
+    if value.startswith("+"):
+        return f"+{digits}"
+    digits = digits.lstrip("0")
+    if digits.startswith(LEAD_PHONE_COUNTRY_CODE) and len(digits) >= 12:
+        return f"+{digits}"
+    return f"+{LEAD_PHONE_COUNTRY_CODE}{digits}"
+
+
+def build_lead_query(
     status: Optional[str] = None,
     plano: Optional[str] = None,
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
-    username: str = Depends(verify_token)
-):
-    db = get_db()
+    q: Optional[str] = None,
+) -> dict:
     query = {}
+    phone = lead_phone_prefix(q) if q else None
+    if phone:
+        # The $type clause lets the partial fingerprint index serve the prefix
+        query["telefone_e164"] = {"$type": "string", "$regex": f"^{re.escape(phone)}"}
+    elif q and q.strip():
+        query["$text"] = {"$search": q.strip()}
     if status:
         query["status"] = status
     if plano:
@@ -453,43 +2744,618 @@ async def get_leads(
             query["created_at"]["$gte"] = data_inicio
         if data_fim:
             query["created_at"]["$lte"] = data_fim
+    return query
+
 
-    leads = []
-    async for row in db.leads.find(query, {"_id": 0}).sort("created_at", DESCENDING):
-        leads.append(row)
+def encode_lead_cursor(row: dict) -> str:
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_lead_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, lead_id = json.loads(raw)
+        if not isinstance(created_at, str) or not isinstance(lead_id, str):
+            raise ValueError
+        return created_at, lead_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+# Text scores cannot be used in a range filter, so search pages are addressed
+# by offset instead of by the last row
+def encode_search_cursor(offset: int) -> str:
+    raw = json.dumps([offset]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        (offset,) = json.loads(raw)
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError
+        return offset
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def parse_lead_fields(fields: Optional[str]) -> Optional[dict]:
+    if not fields:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in LeadResponse.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos inválidos: {', '.join(unknown)}")
+    # id and created_at are always needed to build the next cursor
+    return {"_id": 0, "id": 1, "created_at": 1, **{field: 1 for field in selected}}
+
+
+# Filtered counts are cached briefly; the unfiltered total uses collection metadata
+lead_count_cache: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+
+
+async def count_leads(db: AsyncIOMotorDatabase, query: dict) -> int:
+    if not query:
+        return await db.leads.estimated_document_count()
+    key = json.dumps(query, sort_keys=True)
+    cached = lead_count_cache.get(key)
+    now = time.monotonic()
+    if cached and now - cached[0] < LEAD_COUNT_CACHE_TTL:
+        return cached[1]
+    total = await db.leads.count_documents(query)
+    lead_count_cache[key] = (now, total)
+    lead_count_cache.move_to_end(key)
+    while len(lead_count_cache) > LEAD_COUNT_CACHE_SIZE:
+        lead_count_cache.popitem(last=False)
+    return total
+
+
+@api_router.get("/admin/leads", response_model=List[LeadResponse])
+async def get_leads(
+    response: Response,
+    status: Optional[str] = None,
+    plano: Optional[str] = None,
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=200),
+    # Bounded even when omitted, so no request reads the whole collection
+    limit: int = Query(LEADS_PAGE_MAX, ge=1, le=LEADS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    count: bool = False,
+    username: str = Depends(verify_token)
+):
+    db = get_db()
+    query = build_lead_query(status, plano, data_inicio, data_fim, q)
+    projection = parse_lead_fields(fields)
+
+    headers = {}
+    if count:
+        headers["X-Total-Count"] = str(await count_leads(db, query))
+
+    # Searches are ranked by relevance and paged by offset; listings use the
+    # (created_at, id) keyset
+    search = "$text" in query
+    offset = 0
+    page_query = query
+    if search:
+        offset = decode_search_cursor(cursor) if cursor else 0
+        sort = [("score", {"$meta": "textScore"}), ("created_at", DESCENDING), ("id", DESCENDING)]
+    else:
+        sort = [("created_at", DESCENDING), ("id", DESCENDING)]
+        if cursor:
+            created_at, lead_id = decode_lead_cursor(cursor)
+            after = {
+                "$or": [
+                    {"created_at": {"$lt": created_at}},
+                    {"created_at": created_at, "id": {"$lt": lead_id}},
+                ]
+            }
+            page_query = {"$and": [query, after]} if query else after
+
+    rows = db.leads.find(page_query, projection or LEAD_BLOB_PROJECTION).sort(sort).skip(offset).limit(limit + 1)
+    leads = [row async for row in rows]
+    if len(leads) > limit:
+        leads = leads[:limit]
+        headers["X-Next-Cursor"] = encode_search_cursor(offset + limit) if search else encode_lead_cursor(leads[-1])
+
+    if projection is not None:
+        # Partial documents do not satisfy LeadResponse, so skip its validation
+        return JSONResponse(content=leads, headers=headers)
+    response.headers.update(headers)
     return leads
 
+async def lead_stream_authorized(token: str) -> bool:
+    try:
+        await verify_token_value(token)
+    except HTTPException:
+        return False
+    return True
+
+
+@api_router.get("/admin/leads/stream")
+async def stream_leads(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    username: str = Depends(verify_token),
+):
+    db = get_db()
+    since = lead_stream_replay_since(request.headers.get("last-event-id"))
+
+    async def events():
+        connected_at = datetime.now(timezone.utc).isoformat()
+        # The token is checked again every heartbeat interval, so an expired
+        # or revoked session stops receiving leads on an open connection too
+        recheck_at = time.monotonic() + LEAD_STREAM_HEARTBEAT
+        queue = lead_feed.subscribe(db)
+        try:
+            yield f"retry: {LEAD_STREAM_HEARTBEAT * 1000}\n\n"
+            if since is not None:
+                # Subscribed first, so nothing falls between the replay and live events
+                replay = await replay_lead_events(db, since)
+                if replay is None:
+                    yield "event: reset\ndata: {}\n\n"
+                else:
+                    for message in replay:
+                        yield message
+            # Resume point for a client that gets no live event before dropping
+            yield f"id: {connected_at}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), LEAD_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    message = ": ping\n\n"
+                if time.monotonic() >= recheck_at:
+                    if not await lead_stream_authorized(credentials.credentials):
+                        yield "event: unauthorized\ndata: {}\n\n"
+                        return
+                    recheck_at = time.monotonic() + LEAD_STREAM_HEARTBEAT
+                if message is None:
+                    yield "event: evicted\ndata: {}\n\n"
+                    return
+                yield message
+        finally:
+            lead_feed.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Query diagnostics
+def lead_query_shapes(status: str, plano: str, since: str) -> List[Tuple[str, dict]]:
+    return [
+        ("unfiltered", build_lead_query()),
+        ("status", build_lead_query(status=status)),
+        ("plano", build_lead_query(plano=plano)),
+        ("status_plano", build_lead_query(status=status, plano=plano)),
+        ("date_range", build_lead_query(data_inicio=since)),
+        ("status_date_range", build_lead_query(status=status, data_inicio=since)),
+    ]
+
+
+def summarize_plan(plan: dict) -> Tuple[List[str], List[str]]:
+    # Newer servers (SBE) nest the classic tree under queryPlan
+    stages, indexes = [], []
+    pending = [plan.get("queryPlan", plan)]
+    while pending:
+        stage = pending.pop()
+        stages.append(stage.get("stage", "?"))
+        if stage.get("indexName"):
+            indexes.append(stage["indexName"])
+        if "inputStage" in stage:
+            pending.append(stage["inputStage"])
+        pending.extend(reversed(stage.get("inputStages", [])))
+    return stages, indexes
+
+
+@api_router.get("/admin/leads/explain")
+async def explain_lead_queries(
+    status: Optional[str] = None,
+    plano: Optional[str] = None,
+    days: int = Query(30, ge=1),
+    limit: int = Query(50, ge=1, le=LEADS_PAGE_MAX),
+    username: str = Depends(verify_token)
+):
+    db = get_db()
+    # Default to values that exist, so selective shapes actually return rows
+    latest = await db.leads.find_one({}, {"_id": 0, "status": 1, "plano": 1}, sort=[("created_at", DESCENDING)]) or {}
+    status = status or latest.get("status") or "novo"
+    plano = plano or latest.get("plano") or "Plano Essencial"
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+    shapes = []
+    for name, query in lead_query_shapes(status, plano, since):
+        explained = await db.command(
+            {
+                "explain": {
+                    "find": "leads",
+                    "filter": query,
+                    "sort": {"created_at": -1, "id": -1},
+                    "limit": limit,
+                },
+                "verbosity": "executionStats",
+            }
+        )
+        stats = explained.get("executionStats", {})
+        stages, indexes = summarize_plan(explained.get("queryPlanner", {}).get("winningPlan", {}))
+        returned = stats.get("nReturned", 0)
+        examined = stats.get("totalDocsExamined", 0)
+        shapes.append(
+            {
+                "name": name,
+                "filter": query,
+                "stages": stages,
+                "indexes": indexes,
+                "collection_scan": "COLLSCAN" in stages,
+                "in_memory_sort": "SORT" in stages,
+                "returned": returned,
+                "docs_examined": examined,
+                "keys_examined": stats.get("totalKeysExamined", 0),
+                "execution_ms": stats.get("executionTimeMillis", 0),
+                "docs_examined_per_returned": round(examined / returned, 2) if returned else float(examined),
+            }
+        )
+
+    return {"total_leads": await db.leads.estimated_document_count(), "limit": limit, "shapes": shapes}
+
 @api_router.patch("/admin/leads/{lead_id}")
 async def update_lead_status(lead_id: str, data: LeadStatusUpdate, username: str = Depends(verify_token)):
     db = get_db()
-    result = await db.leads.update_one({"id": lead_id}, {"$set": {"status": data.status}})
-    if result.matched_count == 0:
+    previous = await db.leads.find_one_and_update(
+        {"id": lead_id},
+        {"$set": {"status": data.status, "updated_at": datetime.now(timezone.utc).isoformat()}},
+        projection={"_id": 0, "status": 1, "created_at": 1, **{field: 1 for field in LEAD_STATS_DIMENSIONS}},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if previous is None:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
+    await apply_lead_stats(db, previous, {**previous, "status": data.status})
     return {"message": "Status atualizado"}
 
+
+@api_router.get("/admin/leads/stats")
+async def get_lead_stats(username: str = Depends(verify_token)):
+    db = get_db()
+    stats = {"total": 0, "plano_status": {}, **{dimension: {} for dimension in (*LEAD_STATS_DIMENSIONS, "dia", "semana")}}
+    async for bucket in db.lead_stats.find({"count": {"$gt": 0}}, {"_id": 0}):
+        dimension, value, count = bucket["dimension"], bucket["value"], bucket["count"]
+        if dimension == "total":
+            stats["total"] = count
+        elif dimension == "plano_status":
+            stats["plano_status"].setdefault(value["plano"], {})[value["status"]] = count
+        elif dimension in stats:
+            stats[dimension][value] = count
+    stats["dia"] = dict(sorted(stats["dia"].items()))
+    stats["semana"] = dict(sorted(stats["semana"].items()))
+    return stats
+
+
+@api_router.post("/admin/leads/stats/rebuild")
+async def rebuild_lead_stats_route(username: str = Depends(verify_token)):
+    buckets = await rebuild_lead_stats(get_db())
+    return {"message": "Estatísticas recalculadas", "buckets": buckets}
+
+
+def parse_range_header(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    # Returns an inclusive (start, end) pair, None to serve the full body, or
+    # raises 416 when the range cannot be satisfied. Multi-range requests and
+    # headers that do not parse are answered with the full body, as RFC 9110
+    # allows and requires respectively.
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, dash, end_text = header[len("bytes="):].strip().partition("-")
+    if not dash or not (start_text or end_text):
+        return None
+    if any(text and not (text.isascii() and text.isdigit()) for text in (start_text, end_text)):
+        return None
+    if start_text:
+        start = int(start_text)
+        end = int(end_text) if end_text else length - 1
+        if end_text and end < start:
+            return None
+    else:
+        suffix = int(end_text)
+        start, end = (max(length - suffix, 0), length - 1) if suffix else (length, length)
+    if start >= length:
+        raise HTTPException(
+            status_code=416,
+            detail="Intervalo solicitado inválido",
+            headers={"Content-Range": f"bytes */{length}"},
+        )
+    return start, min(end, length - 1)
+
+
+@api_router.get("/admin/leads/{lead_id}/files/{kind}")
+async def download_lead_file(lead_id: str, kind: str, request: Request, username: str = Depends(verify_token)):
+    if kind not in LEAD_FILE_KINDS:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+
+    db = get_db()
+    fields = ["id", "nome", "tipo", "sha256", "base64"]
+    lead = await db.leads.find_one(
+        {"id": lead_id}, {"_id": 0, **{f"{kind}_arquivo_{field}": 1 for field in fields}}
+    )
+    if not lead:
+        raise HTTPException(status_code=404, detail="Lead não encontrado")
+
+    digest = lead.get(f"{kind}_arquivo_sha256")
+    if lead.get(f"{kind}_arquivo_id"):
+        try:
+            reader = await get_blob_store().open(lead[f"{kind}_arquivo_id"])
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    elif lead.get(f"{kind}_arquivo_base64"):
+        data = base64.b64decode(lead[f"{kind}_arquivo_base64"])
+        digest = hashlib.sha256(data).hexdigest()
+        reader = InlineBlobReader(data)
+    else:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+
+    filename = lead.get(f"{kind}_arquivo_nome") or kind
+    # Legacy attachments and anything outside the allowlist are only ever
+    # offered as a download, never rendered
+    media_type = lead_file_type(lead.get(f"{kind}_arquivo_tipo"))
+    disposition = "inline" if media_type else "attachment"
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=3600",
+        "Content-Disposition": f"{disposition}; filename*=UTF-8''{quote(filename)}",
+        "X-Content-Type-Options": "nosniff",
+    }
+    if digest:
+        headers["ETag"] = f'"{digest}"'
+
+    try:
+        if digest and _etag_matches(request.headers.get("if-none-match"), digest):
+            await reader.close()
+            return Response(status_code=304, headers=headers)
+
+        byte_range = None
+        if_range = request.headers.get("if-range")
+        if if_range is None or (digest and if_range.strip() == f'"{digest}"'):
+            byte_range = parse_range_header(request.headers.get("range"), reader.length)
+    except Exception:
+        await reader.close()
+        raise
+
+    status_code = 200
+    start, end = 0, reader.length - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{reader.length}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    async def body():
+        try:
+            await reader.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await reader.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await reader.close()
+
+    return StreamingResponse(
+        body(),
+        status_code=status_code,
+        media_type=media_type or "application/octet-stream",
+        headers=headers,
+    )
+
+LEAD_EXPORT_COLUMNS = [
+    ("ID", "id"),
+    ("Nome", "nome"),
+    ("Email", "email"),
+    ("Empresa", "empresa"),
+    ("Telefone", "telefone"),
+    ("Cidade", "cidade"),
+    ("Plano", "plano"),
+    ("Potência", "potencia"),
+    ("Concessionária", "concessionaria"),
+    ("Observações", "observacoes"),
+    ("Conta de Luz (arquivo)", "conta_luz_arquivo_nome"),
+    ("Monitoramento (arquivo)", "monitoramento_arquivo_nome"),
+    ("Status", "status"),
+    ("Data", "created_at"),
+]
+LEAD_EXPORT_PROJECTION = {"_id": 0, **{field: 1 for _, field in LEAD_EXPORT_COLUMNS}}
+
+
+class _EchoWriter:
+    def write(self, value):
+        return value
+
+
+async def iter_lead_export_rows(db: AsyncIOMotorDatabase, query: dict) -> AsyncIterator[list]:
+    rows = db.leads.find(query, LEAD_EXPORT_PROJECTION).sort([("created_at", DESCENDING), ("id", DESCENDING)])
+    async for row in rows:
+        yield [row.get(field) for _, field in LEAD_EXPORT_COLUMNS]
+
+
+async def iter_lead_csv(db: AsyncIOMotorDatabase, query: dict) -> AsyncIterator[str]:
+    writer = csv.writer(_EchoWriter(), lineterminator="\n")
+    buffer = [writer.writerow([header for header, _ in LEAD_EXPORT_COLUMNS])]
+    size = len(buffer[0])
+    async for values in iter_lead_export_rows(db, query):
+        line = writer.writerow(["" if value is None else value for value in values])
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_FLUSH_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+async def iter_json_wrapped_csv(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    # Legacy {"csv": "..."} shape, escaped chunk by chunk
+    yield '{"csv":"'
+    async for chunk in chunks:
+        yield json.dumps(chunk, ensure_ascii=False)[1:-1]
+    yield '"}'
+
+
+async def iter_gzip(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def iter_lead_ndjson(db: AsyncIOMotorDatabase, query: dict) -> AsyncIterator[str]:
+    fields = [field for _, field in LEAD_EXPORT_COLUMNS]
+    buffer, size = [], 0
+    async for values in iter_lead_export_rows(db, query):
+        line = json.dumps(dict(zip(fields, values)), ensure_ascii=False) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_FLUSH_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+# Columnar/binary writers run on export_executor; they only see plain row lists
+class ParquetExportWriter:
+    media_type = "application/vnd.apache.parquet"
+
+    def __init__(self, fileobj):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([(field, pa.string()) for _, field in LEAD_EXPORT_COLUMNS])
+        self.writer = pq.ParquetWriter(fileobj, self.schema, compression="zstd")
+
+    def write_batch(self, rows: List[list]):
+        columns = [[None if value is None else str(value) for value in column] for column in zip(*rows)]
+        self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class XlsxExportWriter:
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    def __init__(self, fileobj):
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        self.fileobj = fileobj
+        self.illegal_characters = ILLEGAL_CHARACTERS_RE
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("Leads")
+        self.sheet.append([header for header, _ in LEAD_EXPORT_COLUMNS])
+
+    def write_batch(self, rows: List[list]):
+        for row in rows:
+            self.sheet.append(
+                [None if value is None else self.illegal_characters.sub("", str(value)) for value in row]
+            )
+
+    def close(self):
+        self.workbook.save(self.fileobj)
+
+
+LEAD_EXPORT_WRITERS = {"parquet": ParquetExportWriter, "xlsx": XlsxExportWriter}
+
+
+async def build_spooled_export(db: AsyncIOMotorDatabase, query: dict, export_format: str):
+    loop = asyncio.get_running_loop()
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MEMORY)
+    try:
+        try:
+            writer = await loop.run_in_executor(export_executor, LEAD_EXPORT_WRITERS[export_format], spool)
+        except ImportError:
+            raise HTTPException(status_code=501, detail=f"Exportação {export_format} indisponível neste servidor")
+        batch = []
+        async for values in iter_lead_export_rows(db, query):
+            batch.append(values)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                await loop.run_in_executor(export_executor, writer.write_batch, batch)
+                batch = []
+        if batch:
+            await loop.run_in_executor(export_executor, writer.write_batch, batch)
+        await loop.run_in_executor(export_executor, writer.close)
+    except Exception:
+        spool.close()
+        raise
+    return spool, writer.media_type
+
+
+async def iter_spooled_file(spool) -> AsyncIterator[bytes]:
+    try:
+        await asyncio.to_thread(spool.seek, 0)
+        while True:
+            chunk = await asyncio.to_thread(spool.read, EXPORT_FLUSH_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        spool.close()
+
+
+def export_filename(extension: str) -> str:
+    return f"leads-alluz-{datetime.now(timezone.utc).date().isoformat()}.{extension}"
+
+
 @api_router.get("/admin/leads/export")
-async def export_leads_csv(username: str = Depends(verify_token)):
+async def export_leads_csv(
+    status: Optional[str] = None,
+    plano: Optional[str] = None,
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=200),
+    format: str = Query("csv", pattern="^(csv|json|ndjson|parquet|xlsx)$"),
+    compress: bool = False,
+    username: str = Depends(verify_token)
+):
     db = get_db()
-    csv_content = "ID,Nome,Email,Empresa,Telefone,Cidade,Plano,Potência,Concessionária,Observações,Conta de Luz (arquivo),Monitoramento (arquivo),Status,Data\n"
-    async for row in db.leads.find({}, {"_id": 0}).sort("created_at", DESCENDING):
-        cols = [
-            row.get("id"),
-            row.get("nome"),
-            row.get("email"),
-            row.get("empresa"),
-            row.get("telefone"),
-            row.get("cidade"),
-            row.get("plano"),
-            row.get("potencia"),
-            row.get("concessionaria"),
-            row.get("observacoes"),
-            row.get("conta_luz_arquivo_nome"),
-            row.get("monitoramento_arquivo_nome"),
-            row.get("status"),
-            row.get("created_at"),
-        ]
-        csv_content += ",".join([f'"{str(col or "")}"' for col in cols]) + "\n"
-    return {"csv": csv_content}
+    query = build_lead_query(status, plano, data_inicio, data_fim, q)
+
+    if format in LEAD_EXPORT_WRITERS:
+        spool, media_type = await build_spooled_export(db, query, format)
+        size = await asyncio.to_thread(spool.seek, 0, os.SEEK_END)
+        return StreamingResponse(
+            iter_spooled_file(spool),
+            media_type=media_type,
+            headers={
+                "Content-Disposition": f'attachment; filename="{export_filename(format)}"',
+                "Content-Length": str(size),
+            },
+        )
+
+    if format == "json":
+        return StreamingResponse(iter_json_wrapped_csv(iter_lead_csv(db, query)), media_type="application/json")
+
+    if format == "ndjson":
+        chunks, media_type, filename = iter_lead_ndjson(db, query), "application/x-ndjson", export_filename("ndjson")
+    else:
+        chunks, media_type, filename = iter_lead_csv(db, query), "text/csv; charset=utf-8", export_filename("csv")
+    if compress:
+        return StreamingResponse(
+            iter_gzip(chunks),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.gz"'},
+        )
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 # Admin plans management
 @api_router.post("/admin/plans", response_model=PlanResponse)
@@ -507,6 +3373,7 @@ async def create_plan(plan: PlanCreate, username: str = Depends(verify_token)):
             "badge": plan.badge,
         }
     )
+    await invalidate_site_cache(db)
     return {
         "id": plan_id,
         "nome": plan.nome,
@@ -535,6 +3402,7 @@ async def update_plan(plan_id: str, plan: PlanCreate, username: str = Depends(ve
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Plano não encontrado")
+    await invalidate_site_cache(db)
     return {
         "id": plan_id,
         "nome": plan.nome,
@@ -551,6 +3419,7 @@ async def delete_plan(plan_id: str, username: str = Depends(verify_token)):
     result = await db.plans.delete_one({"id": plan_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Plano não encontrado")
+    await invalidate_site_cache(db)
     return {"message": "Plano excluído"}
 
 
@@ -558,83 +3427,50 @@ async def delete_plan(plan_id: str, username: str = Depends(verify_token)):
 @api_router.get("/admin/faq", response_model=List[FAQItem])
 async def get_faq_items(username: str = Depends(verify_token)):
     db = get_db()
-    faq_doc = await db.content.find_one({"key": "faq_itens"}, {"_id": 0, "value": 1})
-    faq_items = []
-
-    if faq_doc and faq_doc.get("value"):
-        try:
-            parsed = json.loads(faq_doc["value"])
-            if isinstance(parsed, list):
-                for index, item in enumerate(parsed):
-                    faq_items.append(
-                        {
-                            "id": item.get("id") or str(index),
-                            "pergunta": item.get("pergunta", ""),
-                            "resposta": item.get("resposta", ""),
-                        }
-                    )
-        except json.JSONDecodeError:
-            pass
-
-    return faq_items
+    return [row async for row in db.faq.find({}, FAQ_PROJECTION).sort([("ordem", ASCENDING), ("id", ASCENDING)])]
 
 
 @api_router.post("/admin/faq", response_model=FAQItem)
 async def create_faq_item(data: FAQCreate, username: str = Depends(verify_token)):
     db = get_db()
-    faq_doc = await db.content.find_one({"key": "faq_itens"}, {"_id": 0, "value": 1})
-    items = []
-
-    if faq_doc and faq_doc.get("value"):
-        try:
-            parsed = json.loads(faq_doc["value"])
-            if isinstance(parsed, list):
-                items = parsed
-        except json.JSONDecodeError:
-            pass
-
+    last = await db.faq.find_one({}, {"_id": 0, "ordem": 1}, sort=[("ordem", DESCENDING)])
     new_item = {"id": str(uuid.uuid4()), "pergunta": data.pergunta, "resposta": data.resposta}
-    items.append(new_item)
-
-    await db.content.update_one(
-        {"key": "faq_itens"},
-        {"$set": {"value": json.dumps(items)}},
-        upsert=True,
-    )
+    await db.faq.insert_one({**new_item, "ordem": (last["ordem"] + 1) if last else 0})
+    await invalidate_site_cache(db)
 
     return new_item
 
 
-@api_router.put("/admin/faq/{faq_id}", response_model=FAQItem)
-async def update_faq_item(faq_id: str, data: FAQUpdate, username: str = Depends(verify_token)):
+@api_router.put("/admin/faq/order", response_model=List[FAQItem])
+async def reorder_faq_items(data: FAQOrder, username: str = Depends(verify_token)):
     db = get_db()
-    faq_doc = await db.content.find_one({"key": "faq_itens"}, {"_id": 0, "value": 1})
-    items = []
+    if len(set(data.ids)) != len(data.ids):
+        raise HTTPException(status_code=400, detail="IDs de FAQ repetidos")
+    if data.ids:
+        # Validate before writing so a bad request never half-applies an order
+        if await db.faq.count_documents({"id": {"$in": data.ids}}) != len(data.ids):
+            raise HTTPException(status_code=404, detail="FAQ não encontrada")
+        result = await db.faq.bulk_write(
+            [UpdateOne({"id": faq_id}, {"$set": {"ordem": index}}) for index, faq_id in enumerate(data.ids)],
+            ordered=False,
+        )
+        if result.matched_count:
+            await invalidate_site_cache(db)
 
-    if faq_doc and faq_doc.get("value"):
-        try:
-            parsed = json.loads(faq_doc["value"])
-            if isinstance(parsed, list):
-                items = parsed
-        except json.JSONDecodeError:
-            pass
+    return [row async for row in db.faq.find({}, FAQ_PROJECTION).sort([("ordem", ASCENDING), ("id", ASCENDING)])]
 
-    updated_item = None
-    for item in items:
-        if item.get("id") == faq_id:
-            item["pergunta"] = data.pergunta
-            item["resposta"] = data.resposta
-            updated_item = item
-            break
 
+@api_router.put("/admin/faq/{faq_id}", response_model=FAQItem)
+async def update_faq_item(faq_id: str, data: FAQUpdate, username: str = Depends(verify_token)):
+    db = get_db()
+    updated_item = await db.faq.find_one_and_update(
+        {"id": faq_id},
+        {"$set": {"pergunta": data.pergunta, "resposta": data.resposta}},
+        return_document=ReturnDocument.AFTER,
+    )
     if updated_item is None:
         raise HTTPException(status_code=404, detail="FAQ não encontrada")
-
-    await db.content.update_one(
-        {"key": "faq_itens"},
-        {"$set": {"value": json.dumps(items)}},
-        upsert=True,
-    )
+    await invalidate_site_cache(db)
 
     return updated_item
 
@@ -642,47 +3478,89 @@ async def update_faq_item(faq_id: str, data: FAQUpdate, username: str = Depends(
 @api_router.delete("/admin/faq/{faq_id}")
 async def delete_faq_item(faq_id: str, username: str = Depends(verify_token)):
     db = get_db()
-    faq_doc = await db.content.find_one({"key": "faq_itens"}, {"_id": 0, "value": 1})
-    items = []
-
-    if faq_doc and faq_doc.get("value"):
-        try:
-            parsed = json.loads(faq_doc["value"])
-            if isinstance(parsed, list):
-                items = parsed
-        except json.JSONDecodeError:
-            pass
-
-    filtered_items = [item for item in items if item.get("id") != faq_id]
-    if len(filtered_items) == len(items):
+    result = await db.faq.delete_one({"id": faq_id})
+    if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="FAQ não encontrada")
-
-    await db.content.update_one(
-        {"key": "faq_itens"},
-        {"$set": {"value": json.dumps(filtered_items)}},
-        upsert=True,
-    )
+    await invalidate_site_cache(db)
 
     return {"message": "FAQ removida"}
 
 # Admin content management
+async def apply_content_updates(db: AsyncIOMotorDatabase, values: dict):
+    if not values:
+        return
+    operations = [UpdateOne({"key": key}, {"$set": {"value": value}}, upsert=True) for key, value in values.items()]
+
+    async def write(session=None):
+        await db.content.bulk_write(operations, ordered=True, session=session)
+        await invalidate_site_cache(db, session=session)
+
+    await run_transaction(db, write)
+    # A reader may have reloaded between invalidation and commit
+    site_cache.invalidate()
+
+
 @api_router.put("/admin/content")
 async def update_content(data: ContentUpdate, username: str = Depends(verify_token)):
+    if data.key == "faq_itens":
+        raise HTTPException(status_code=400, detail="Use /api/admin/faq para editar a FAQ")
     db = get_db()
     await db.content.update_one({"key": data.key}, {"$set": {"value": data.value}}, upsert=True)
+    await invalidate_site_cache(db)
     return {"message": "Conteúdo atualizado"}
 
+@api_router.put("/admin/content/bulk")
+async def update_content_bulk(data: ContentBulkUpdate, username: str = Depends(verify_token)):
+    values = {item.key: item.value for item in data.items}
+    if "faq_itens" in values:
+        raise HTTPException(status_code=400, detail="Use /api/admin/faq para editar a FAQ")
+    await apply_content_updates(get_db(), values)
+    return {"message": "Conteúdo atualizado", "updated": len(values)}
+
 @api_router.put("/admin/whatsapp")
 async def update_whatsapp(data: WhatsAppConfig, username: str = Depends(verify_token)):
-    db = get_db()
-    await db.content.update_one(
-        {"key": "whatsapp_numero"}, {"$set": {"value": data.numero}}, upsert=True
-    )
-    await db.content.update_one(
-        {"key": "whatsapp_mensagem"}, {"$set": {"value": data.mensagem_template}}, upsert=True
+    await apply_content_updates(
+        get_db(), {"whatsapp_numero": data.numero, "whatsapp_mensagem": data.mensagem_template}
     )
     return {"message": "WhatsApp atualizado"}
 
+# Health checks (outside /api so probes bypass routing and CORS concerns)
+app_state = {"ready": False}
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    checks = {
+        "started": app_state["ready"],
+        "site_cache_warm": site_cache.snapshot is not None,
+        "database": False,
+    }
+    if mongo_db is not None:
+        try:
+            await asyncio.wait_for(mongo_db.command("ping"), timeout=READINESS_TIMEOUT)
+            checks["database"] = True
+        except (asyncio.TimeoutError, PyMongoError):
+            pass
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "unavailable", "checks": checks, "pool": pool_stats.snapshot()},
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    presented = request.headers.get("authorization", "").encode("utf-8")
+    if not hmac.compare_digest(presented, f"Bearer {METRICS_TOKEN}".encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Não autorizado")
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
 # Include the router
 app.include_router(api_router)
 
@@ -700,6 +3578,7 @@ cors_origin_regex = os.environ.get(
 )
 allow_credentials = "*" not in cors_origins
 
+app.add_middleware(UploadAdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=allow_credentials,
@@ -707,7 +3586,9 @@ app.add_middleware(
     allow_origin_regex=cors_origin_regex,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "Retry-After", "Upload-Offset"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -716,11 +3597,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("startup")
 async def startup():
     await init_db()
+    # Open pool connections and load the site snapshot before taking traffic
+    await asyncio.gather(*(mongo_db.command("ping") for _ in range(MONGO_WARM_CONNECTIONS)))
+    await site_cache.get(mongo_db)
+    site_cache.start(mongo_db)
+    if OUTBOX_WORKER == "inline" and outbox_sinks:
+        outbox_worker.start(mongo_db)
+    upload_sweeper.start(mongo_db)
+    app_state["ready"] = True
 
-@app.on_event("shutdown")
 async def shutdown():
+    app_state["ready"] = False
+    await site_cache.stop()
+    lead_feed.stop()
+    await lead_batcher.drain()
+    await outbox_worker.stop()
+    await upload_sweeper.stop()
+    export_executor.shutdown(wait=False, cancel_futures=True)
+    password_hasher.executor.shutdown(wait=False, cancel_futures=True)
     if mongo_client is not None:
         mongo_client.close()
@@ -0,0 +1,123 @@
+"""Local SMTP and HTTP stand-ins for the lead notification sinks.
+
+Accepts mail and webhook calls without sending anything anywhere and prints
+each one as a JSON line, so the outbox can be exercised end to end:
+
+    python sink_stand_in.py --fail-rate 0.3
+    OUTBOX_SINKS=email,webhook SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_STARTTLS=0 \\
+        NOTIFY_EMAIL_TO=vendas@example.com CRM_WEBHOOK_URL=http://127.0.0.1:8025/leads \\
+        uvicorn server:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from email import message_from_bytes
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+
+def emit(record: dict):
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+
+
+def smtp_handler(fail_rate: float):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def reply(line: str):
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        sender, recipients = None, []
+        await reply("220 sink-stand-in ESMTP")
+        while True:
+            raw = await reader.readline()
+            if not raw:
+                break
+            command = raw.decode(errors="replace").strip()
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO"):
+                await reply("250 sink-stand-in")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip(" <>"), []
+                await reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip(" <>"))
+                await reply("250 OK")
+            elif verb == "DATA":
+                await reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = await reader.readline()
+                    if line in (b".\r\n", b".\n", b""):
+                        break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                message = message_from_bytes(b"".join(lines), policy=default_policy)
+                if random.random() < fail_rate:
+                    await reply("451 Stand-in temporary failure")
+                    continue
+                emit(
+                    {
+                        "sink": "smtp",
+                        "from": sender,
+                        "to": recipients,
+                        "subject": message["Subject"],
+                        "outbox_id": message["X-Outbox-Id"],
+                        "body": message.get_content(),
+                    }
+                )
+                await reply("250 OK")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                await reply("250 OK")
+            elif verb == "NOOP":
+                await reply("250 OK")
+            elif verb == "QUIT":
+                await reply("221 Bye")
+                break
+            else:
+                await reply("502 Command not implemented")
+        writer.close()
+
+    return handle
+
+
+def http_handler(fail_rate: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            status = 503 if random.random() < fail_rate else 200
+            if status == 200:
+                emit({"sink": "http", "path": self.path, "body": json.loads(body or b"null")})
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+async def main(args) -> int:
+    http = ThreadingHTTPServer((args.host, args.http_port), http_handler(args.fail_rate))
+    Thread(target=http.serve_forever, daemon=True).start()
+    smtp = await asyncio.start_server(smtp_handler(args.fail_rate), args.host, args.smtp_port)
+    print(f"SMTP on {args.host}:{args.smtp_port}, HTTP on {args.host}:{args.http_port}", file=sys.stderr)
+    async with smtp:
+        await smtp.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--smtp-port", type=int, default=1025)
+    parser.add_argument("--http-port", type=int, default=8025)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of deliveries to reject, to exercise retries")
+    args = parser.parse_args()
+    try:
+        sys.exit(asyncio.run(main(args)))
+    except KeyboardInterrupt:
+        sys.exit(0)
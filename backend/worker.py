@@ -0,0 +1,39 @@
+"""Deliver queued lead notifications outside the API process.
+
+Run alongside the API with OUTBOX_WORKER=off so delivery does not share the
+API's CPU; any number of workers can run, the outbox leases keep them apart.
+
+    python worker.py          # deliver until interrupted
+    python worker.py --once   # deliver one batch and exit
+"""
+import argparse
+import asyncio
+import sys
+
+import server
+
+
+async def main(once: bool) -> int:
+    await server.init_db()
+    if not server.outbox_sinks:
+        print("Configure OUTBOX_SINKS no ambiente", file=sys.stderr)
+        return 2
+    try:
+        if once:
+            delivered = await server.outbox_worker.run_once(server.mongo_db)
+            print(f"Processed {delivered} outbox entries")
+        else:
+            await server.outbox_worker.run(server.mongo_db)
+        return 0
+    finally:
+        server.mongo_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="process a single batch and exit")
+    args = parser.parse_args()
+    try:
+        sys.exit(asyncio.run(main(args.once)))
+    except KeyboardInterrupt:
+        sys.exit(0)
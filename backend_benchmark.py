@@ -0,0 +1,292 @@
+"""Throughput and tail-latency benchmark for the Alluz Energia API.
+
+Runs the FastAPI app in-process (no uvicorn, no network) against either a
+local mongod (--mongo-url) or the in-memory mongomock-motor stand-in, drives
+each scenario with an async client at a fixed concurrency and writes
+p50/p95/p99, RPS and peak RSS to backend_benchmark_results.json.
+
+    python backend_benchmark.py --requests 2000 --concurrency 50
+    python backend_benchmark.py --baseline backend_benchmark_baseline.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+BENCHMARK_DB_NAME = "alluz_benchmark"
+
+
+def configure_environment(args, blob_dir):
+    # server.py reads its configuration at import time
+    os.environ["MONGO_URL"] = args.mongo_url or "mongodb://benchmark-stand-in"
+    os.environ["MONGO_DB_NAME"] = BENCHMARK_DB_NAME
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = blob_dir
+    os.environ["UPLOAD_MAX_BYTES"] = str(max(args.upload_kb * 1024 * 2, 10 * 1024 * 1024))
+    os.environ["TRUSTED_PROXY_HOPS"] = "1"
+    os.environ["BCRYPT_ROUNDS"] = "4"
+    os.environ["RATE_LIMIT_BACKEND"] = "memory"
+    # The benchmark database starts empty each run
+    os.environ["MIGRATIONS_ON_STARTUP"] = "run"
+    # Measure upload throughput rather than admission shedding unless asked to
+    os.environ.setdefault("UPLOAD_MAX_CONCURRENT", str(args.concurrency))
+    sys.path.insert(0, str(ROOT_DIR / "backend"))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Scenario:
+    def __init__(self, name, build_request):
+        self.name = name
+        self.build_request = build_request
+
+
+class BenchmarkRunner:
+    def __init__(self, args):
+        self.args = args
+        self.token = None
+        self.upload_body = os.urandom(args.upload_kb * 1024)
+        self.sequence = 0
+
+    def next_ip(self):
+        # A distinct forwarded client per request keeps the 5/min limiter out of the measurements
+        self.sequence += 1
+        return f"10.{(self.sequence >> 16) & 255}.{(self.sequence >> 8) & 255}.{self.sequence & 255}"
+
+    def scenarios(self):
+        def landing():
+            path = random.choices(["/api/bootstrap", "/api/content", "/api/plans"], weights=[6, 2, 2])[0]
+            return {"method": "GET", "url": path, "headers": {"Accept-Encoding": "br, gzip"}}
+
+        def lead_burst():
+            return {
+                "method": "POST",
+                "url": "/api/leads",
+                "headers": {"X-Forwarded-For": self.next_ip()},
+                "json": {
+                    "nome": "Benchmark Lead",
+                    "empresa": "Benchmark Ltda",
+                    # Unique contacts so the burst measures inserts, not duplicate merges
+                    "telefone": f"44{900000000 + self.sequence}",
+                    "cidade": "Maringá",
+                    "plano": random.choice(["Plano Essencial", "Plano Avançado", "Plano Completo"]),
+                },
+            }
+
+        def uploads():
+            return {
+                "method": "POST",
+                "url": "/api/leads/form",
+                "headers": {"X-Forwarded-For": self.next_ip()},
+                "data": {"nome": "Benchmark Upload", "email": f"bench{self.sequence}@example.com"},
+                "files": {
+                    "conta_luz_arquivo": ("conta.pdf", self.upload_body, "application/pdf"),
+                    "monitoramento_arquivo": ("print.png", self.upload_body, "image/png"),
+                },
+            }
+
+        def admin():
+            auth = {"Authorization": f"Bearer {self.token}"}
+            if random.random() < 0.9:
+                return {"method": "GET", "url": "/api/admin/leads", "params": {"limit": 50}, "headers": auth}
+            return {"method": "GET", "url": "/api/admin/leads/export", "headers": auth}
+
+        available = {
+            "landing": Scenario("landing", landing),
+            "lead_burst": Scenario("lead_burst", lead_burst),
+            "uploads": Scenario("uploads", uploads),
+            "admin": Scenario("admin", admin),
+        }
+        return [available[name] for name in self.args.scenarios]
+
+    async def seed_leads(self, db, count):
+        now = datetime.now(timezone.utc)
+        batch = []
+        for index in range(count):
+            batch.append(
+                {
+                    "id": f"bench-{index:08d}",
+                    "nome": f"Lead {index}",
+                    "empresa": "Seed",
+                    "telefone": "44999887766",
+                    "cidade": "Maringá",
+                    "plano": "Plano Essencial",
+                    "status": random.choice(["novo", "contatado", "fechado"]),
+                    "created_at": (now - timedelta(minutes=index)).isoformat(),
+                }
+            )
+            if len(batch) == 1000:
+                await db.leads.insert_many(batch)
+                batch = []
+        if batch:
+            await db.leads.insert_many(batch)
+
+    async def run_scenario(self, client, scenario):
+        latencies = []
+        statuses = {}
+        remaining = self.args.requests
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                request = scenario.build_request()
+                start = time.perf_counter()
+                try:
+                    response = await client.request(**request)
+                    await response.aread()
+                    status = str(response.status_code)
+                except Exception as exc:
+                    status = type(exc).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+        return {
+            "requests": len(latencies),
+            "concurrency": self.args.concurrency,
+            "seconds": round(elapsed, 3),
+            "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+            "statuses": statuses,
+        }
+
+    async def run(self):
+        import httpx
+        import server
+
+        stand_in = not self.args.mongo_url
+        if stand_in:
+            try:
+                import mongomock_motor
+            except ImportError:
+                raise SystemExit("Instale mongomock-motor ou informe --mongo-url de um mongod local")
+            server.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+            # The stand-in has no change streams, so skip the site cache watcher
+            await server.init_db()
+            await server.site_cache.get(server.mongo_db)
+            server.app_state["ready"] = True
+        else:
+            await server.startup()
+
+        db = server.mongo_db
+        try:
+            if self.args.seed_leads:
+                print(f"🌱 Seeding {self.args.seed_leads} leads...")
+                await self.seed_leads(db, self.args.seed_leads)
+
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+                login = await client.post("/api/auth/login", json={"username": "admin", "password": "admin123"})
+                login.raise_for_status()
+                self.token = login.json()["access_token"]
+
+                results = {}
+                for scenario in self.scenarios():
+                    print(f"\n🏁 {scenario.name}: {self.args.requests} requests @ concurrency {self.args.concurrency}")
+                    results[scenario.name] = await self.run_scenario(client, scenario)
+                    summary = results[scenario.name]
+                    print(
+                        f"   {summary['rps']} req/s | p50 {summary['p50_ms']} ms | "
+                        f"p95 {summary['p95_ms']} ms | p99 {summary['p99_ms']} ms | errors {summary['error_rate']:.2%}"
+                    )
+                return results
+        finally:
+            if not stand_in:
+                await server.mongo_client.drop_database(BENCHMARK_DB_NAME)
+                await server.shutdown()
+
+
+def compare_with_baseline(results, baseline, max_regression, max_error_rate):
+    failures = []
+    for name, current in results.items():
+        if current["error_rate"] > max_error_rate:
+            failures.append(f"{name}: error rate {current['error_rate']:.2%} > {max_error_rate:.2%}")
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            failures.append(f"{name}: p95 {current['p95_ms']} ms vs baseline {previous['p95_ms']} ms")
+        if current["rps"] < previous["rps"] * (1 - max_regression):
+            failures.append(f"{name}: {current['rps']} req/s vs baseline {previous['rps']} req/s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", help=f"local mongod to use (database {BENCHMARK_DB_NAME} is dropped afterwards)")
+    parser.add_argument("--scenarios", nargs="+", default=["landing", "lead_burst", "uploads", "admin"],
+                        choices=["landing", "lead_burst", "uploads", "admin"])
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=25)
+    parser.add_argument("--upload-kb", type=int, default=512, help="size of each uploaded file")
+    parser.add_argument("--seed-leads", type=int, default=2000, help="leads inserted before the admin scenario")
+    parser.add_argument("--output", default=str(ROOT_DIR / "backend_benchmark_results.json"))
+    parser.add_argument("--baseline", help="previous results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95/RPS regression (0.2 = 20%%)")
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    random.seed(1234)
+    with tempfile.TemporaryDirectory(prefix="alluz-bench-") as blob_dir:
+        configure_environment(args, blob_dir)
+        results = asyncio.run(BenchmarkRunner(args).run())
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "backend": "mongod" if args.mongo_url else "mongomock-motor",
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "upload_kb": args.upload_kb,
+            "seed_leads": args.seed_leads,
+        },
+        "scenarios": results,
+    }
+
+    failures = []
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = compare_with_baseline(results, baseline, args.max_regression, args.max_error_rate)
+    report["regressions"] = failures
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n📊 Peak RSS: {report['peak_rss_mb']} MB — results in {args.output}")
+    if failures:
+        print("⚠️ Regressions detected:")
+        for failure in failures:
+            print(f"   - {failure}")
+        return 1
+    print("🎉 No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
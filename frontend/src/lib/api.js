@@ -20,15 +20,19 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+const expireSession = () => {
+  localStorage.removeItem('alluz_token');
+  if (window.location.pathname.startsWith('/admin/dashboard')) {
+    window.location.href = '/admin';
+  }
+};
+
 // Handle 401 errors
 api.interceptors.response.use(
   (response) => response,
   (error) => {
     if (error.response?.status === 401) {
-      localStorage.removeItem('alluz_token');
-      if (window.location.pathname.startsWith('/admin/dashboard')) {
-        window.location.href = '/admin';
-      }
+      expireSession();
     }
     return Promise.reject(error);
   }
@@ -40,6 +44,10 @@ export const authApi = {
   changePassword: (username, password) => api.post('/auth/change-password', { username, password }),
 };
 
+export const siteApi = {
+  bootstrap: () => api.get('/bootstrap'),
+};
+
 export const contentApi = {
   getAll: () => api.get('/content'),
   update: (key, value) => api.put('/admin/content', { key, value }),
@@ -61,14 +69,93 @@ export const faqApi = {
   delete: (id) => api.delete(`/admin/faq/${id}`),
 };
 
+const UPLOAD_MAX_RETRIES = 6;
+
+const wait = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const sha256Base64 = async (buffer) => {
+  const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', buffer));
+  return btoa(String.fromCharCode(...digest));
+};
+
+const isRetryable = (error) => {
+  const status = error.response?.status;
+  // No response means the connection dropped; 409/460 mean resend from the server's offset
+  return !status || status >= 500 || status === 409 || status === 460;
+};
+
+export const uploadsApi = {
+  // Sends the file in checksummed parts, resuming from the server's offset
+  // after a dropped connection; resolves with the completed upload id
+  upload: async (file, kind) => {
+    const { data: session } = await api.post('/uploads', {
+      kind,
+      nome: file.name,
+      tipo: file.type || null,
+      tamanho: file.size,
+    });
+    const url = `/uploads/${session.id}`;
+    let offset = session.offset;
+    let failures = 0;
+
+    while (offset < file.size) {
+      const part = await file.slice(offset, offset + session.part_size).arrayBuffer();
+      try {
+        const response = await api.patch(url, part, {
+          headers: {
+            'Content-Type': 'application/offset+octet-stream',
+            'Upload-Offset': String(offset),
+            'Upload-Checksum': `sha256 ${await sha256Base64(part)}`,
+          },
+        });
+        offset = Number(response.headers['upload-offset']);
+        failures = 0;
+      } catch (error) {
+        failures += 1;
+        if (!isRetryable(error) || failures > UPLOAD_MAX_RETRIES) {
+          throw error;
+        }
+        await wait(Math.min(1000 * 2 ** failures, 30000));
+        try {
+          offset = (await api.get(url)).data.offset;
+        } catch {
+          // Still offline; the next attempt resends from the last known offset
+        }
+      }
+    }
+
+    for (let attempt = 0; ; attempt += 1) {
+      try {
+        await api.post(`${url}/complete`);
+        return session.id;
+      } catch (error) {
+        if (!isRetryable(error) || attempt >= UPLOAD_MAX_RETRIES) {
+          throw error;
+        }
+        await wait(Math.min(1000 * 2 ** attempt, 30000));
+      }
+    }
+  },
+};
+
 export const leadsApi = {
   create: (lead) => api.post('/leads', lead),
-  createTasting: ({ nome, email, contaLuzArquivo, monitoramentoArquivo }) => {
+  createTasting: async ({ nome, email, contaLuzArquivo, monitoramentoArquivo }) => {
     const formData = new FormData();
     formData.append('nome', nome);
     formData.append('email', email);
-    formData.append('conta_luz_arquivo', contaLuzArquivo);
-    formData.append('monitoramento_arquivo', monitoramentoArquivo);
+    // Web Crypto only exists in secure contexts; elsewhere send the files inline
+    if (window.crypto?.subtle) {
+      const [contaLuzUploadId, monitoramentoUploadId] = await Promise.all([
+        uploadsApi.upload(contaLuzArquivo, 'conta_luz'),
+        uploadsApi.upload(monitoramentoArquivo, 'monitoramento'),
+      ]);
+      formData.append('conta_luz_upload_id', contaLuzUploadId);
+      formData.append('monitoramento_upload_id', monitoramentoUploadId);
+    } else {
+      formData.append('conta_luz_arquivo', contaLuzArquivo);
+      formData.append('monitoramento_arquivo', monitoramentoArquivo);
+    }
 
     return api.post('/leads/form', formData, {
       headers: {
@@ -78,7 +165,49 @@ export const leadsApi = {
   },
   getAll: (params) => api.get('/admin/leads', { params }),
   updateStatus: (id, status) => api.patch(`/admin/leads/${id}`, { status }),
-  exportCsv: () => api.get('/admin/leads/export'),
+  getFile: (id, kind) => api.get(`/admin/leads/${id}/files/${kind}`, { responseType: 'blob' }),
+  exportCsv: (params) => api.get('/admin/leads/export', { params, responseType: 'blob' }),
+  stats: () => api.get('/admin/leads/stats'),
+  // EventSource cannot send the bearer token, so the SSE stream is read with fetch
+  // position.lastEventId is kept current so the next call resumes where this one stopped
+  stream: async (onEvent, signal, position = {}) => {
+    const headers = { Authorization: `Bearer ${localStorage.getItem('alluz_token')}` };
+    if (position.lastEventId) {
+      headers['Last-Event-ID'] = position.lastEventId;
+    }
+    const response = await fetch(`${API_URL}/api/admin/leads/stream`, { headers, signal });
+    if (!response.ok) {
+      if (response.status === 401) expireSession();
+      throw new Error(`Lead stream failed: ${response.status}`);
+    }
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) return;
+      buffer += value;
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = 'message';
+        let id = null;
+        const data = [];
+        for (const line of block.split('\n')) {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+          else if (line.startsWith('id:')) id = line.slice(3).trim();
+        }
+        // Sent when the token expires or is revoked mid-stream
+        if (event === 'unauthorized') {
+          expireSession();
+          throw new Error('Lead stream unauthorized');
+        }
+        if (data.length) onEvent(event, JSON.parse(data.join('\n')));
+        if (id) position.lastEventId = id;
+      }
+    }
+  },
 };
 
 export default api;
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { 
   LogOut, Users, FileText, Settings, LayoutDashboard, 
@@ -19,6 +19,29 @@ import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '@
 import { toast } from 'sonner';
 import { authApi, contentApi, plansApi, leadsApi, faqApi } from '@/lib/api';
 
+const LEADS_PAGE_SIZE = 50;
+const LEAD_SEARCH_DEBOUNCE_MS = 300;
+
+// Filters run on the server, so they cover every lead and not just the
+// pages loaded so far
+const isLeadFilterSet = (value) => Boolean(value) && value !== 'all';
+
+const leadQueryParams = (filters) => {
+  const params = { limit: LEADS_PAGE_SIZE };
+  if (isLeadFilterSet(filters.status)) params.status = filters.status;
+  if (isLeadFilterSet(filters.plano)) params.plano = filters.plano;
+  if (filters.search.trim()) params.q = filters.search.trim();
+  return params;
+};
+
+// Rows edited or streamed in after loading can stop matching the filters
+const matchesLeadFilters = (lead, filters) =>
+  (!isLeadFilterSet(filters.status) || lead.status === filters.status) &&
+  (!isLeadFilterSet(filters.plano) || lead.plano === filters.plano);
+
+// Mirrors LEAD_FILE_TYPES on the server
+const PREVIEWABLE_FILE_TYPES = ['application/pdf', 'image/png', 'image/jpeg', 'image/webp'];
+
 const parseFaqItems = (faqJson) => {
   try {
     const parsed = JSON.parse(faqJson || '[]');
@@ -43,7 +66,16 @@ const AdminDashboard = () => {
 
   // Leads state
   const [leads, setLeads] = useState([]);
+  const [leadsCursor, setLeadsCursor] = useState(null);
+  const [loadingMoreLeads, setLoadingMoreLeads] = useState(false);
+  // Ids already listed, read synchronously by the stream handler
+  const leadIdsRef = useRef(new Set());
   const [leadFilters, setLeadFilters] = useState({ status: '', plano: '', search: '' });
+  const leadFiltersRef = useRef(leadFilters);
+  // Typed text reaches leadFilters.search after a pause, one request per burst
+  const [leadSearchInput, setLeadSearchInput] = useState('');
+  // Bumped per first-page request, so a slow response for old filters is dropped
+  const leadsRequestRef = useRef(0);
   const [filteredLeads, setFilteredLeads] = useState([]);
   const [filePreview, setFilePreview] = useState({
     open: false,
@@ -57,6 +89,7 @@ const AdminDashboard = () => {
   const [content, setContent] = useState({});
   const [editingContent, setEditingContent] = useState(null);
   const [contentValue, setContentValue] = useState('');
+  const [leadStats, setLeadStats] = useState(null);
   const [faqItems, setFaqItems] = useState([]);
   const [faqForm, setFaqForm] = useState({ pergunta: '', resposta: '' });
   const [editingFaqId, setEditingFaqId] = useState(null);
@@ -84,10 +117,69 @@ const AdminDashboard = () => {
     checkAuth();
   }, []);
 
+  useEffect(() => {
+    leadFiltersRef.current = leadFilters;
+    if (user) loadLeads();
+  }, [user, leadFilters]);
+
+  useEffect(() => {
+    const timer = setTimeout(() => {
+      setLeadFilters(prev => (prev.search === leadSearchInput ? prev : { ...prev, search: leadSearchInput }));
+    }, LEAD_SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [leadSearchInput]);
+
   useEffect(() => {
     filterLeads();
   }, [leads, leadFilters]);
 
+  useEffect(() => {
+    leadIdsRef.current = new Set(leads.map(l => l.id));
+  }, [leads]);
+
+  // Live lead updates; after a drop or an eviction it reconnects with the last
+  // event id and the server replays what was missed
+  useEffect(() => {
+    if (!user) return undefined;
+    const controller = new AbortController();
+    const position = { lastEventId: null };
+
+    const handleEvent = (event, data) => {
+      if (event === 'lead.created' && !leadIdsRef.current.has(data.id)) {
+        leadIdsRef.current.add(data.id);
+        // Only the server can tell whether a new lead matches a search
+        if (!leadFiltersRef.current.search.trim()) {
+          setLeads(prev => [data, ...prev]);
+        }
+        setLeadStats(prev => prev && {
+          ...prev,
+          total: prev.total + 1,
+          status: { ...prev.status, [data.status]: (prev.status[data.status] || 0) + 1 },
+        });
+      } else if (event === 'lead.created' || event === 'lead.updated') {
+        setLeads(prev => prev.map(l => (l.id === data.id ? { ...l, ...data } : l)));
+      } else if (event === 'reset') {
+        // Too much changed to replay
+        loadLeads();
+        loadLeadStats();
+      }
+    };
+
+    const connect = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          await leadsApi.stream(handleEvent, controller.signal, position);
+        } catch (error) {
+          if (controller.signal.aborted) return;
+        }
+        await new Promise(resolve => setTimeout(resolve, 5000));
+      }
+    };
+    connect();
+
+    return () => controller.abort();
+  }, [user]);
+
   const checkAuth = async () => {
     const token = localStorage.getItem('alluz_token');
     if (!token) {
@@ -105,15 +197,55 @@ const AdminDashboard = () => {
     }
   };
 
+  const loadLeads = async () => {
+    const request = ++leadsRequestRef.current;
+    try {
+      const response = await leadsApi.getAll(leadQueryParams(leadFiltersRef.current));
+      if (request !== leadsRequestRef.current) return;
+      setLeads(response.data);
+      setLeadsCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast.error('Erro ao carregar leads');
+    }
+  };
+
+  const loadLeadStats = async () => {
+    try {
+      const response = await leadsApi.stats();
+      setLeadStats(response.data);
+    } catch (error) {
+      toast.error('Erro ao carregar estatísticas');
+    }
+  };
+
+  const loadMoreLeads = async () => {
+    if (!leadsCursor) return;
+    const request = leadsRequestRef.current;
+    setLoadingMoreLeads(true);
+    try {
+      const response = await leadsApi.getAll({ ...leadQueryParams(leadFiltersRef.current), cursor: leadsCursor });
+      // The filters changed while this page was loading
+      if (request !== leadsRequestRef.current) return;
+      // Leads that arrived over the stream may already be listed
+      setLeads(prev => [...prev, ...response.data.filter(l => !leadIdsRef.current.has(l.id))]);
+      setLeadsCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast.error('Erro ao carregar leads');
+    } finally {
+      setLoadingMoreLeads(false);
+    }
+  };
+
   const loadData = async () => {
     setLoading(true);
     try {
-      const [leadsRes, contentRes, plansRes] = await Promise.all([
-        leadsApi.getAll(),
+      // Leads are loaded by the leadFilters effect
+      const [statsRes, contentRes, plansRes] = await Promise.all([
+        leadsApi.stats(),
         contentApi.getAll(),
         plansApi.getAll()
       ]);
-      setLeads(leadsRes.data);
+      setLeadStats(statsRes.data);
       setContent(contentRes.data);
       setPlans(plansRes.data);
       const faqRes = await faqApi.getAll();
@@ -131,26 +263,7 @@ const AdminDashboard = () => {
   };
 
   const filterLeads = () => {
-    let filtered = [...leads];
-    
-    if (leadFilters.status) {
-      filtered = filtered.filter(l => l.status === leadFilters.status);
-    }
-    if (leadFilters.plano) {
-      filtered = filtered.filter(l => l.plano === leadFilters.plano);
-    }
-    if (leadFilters.search) {
-      const search = leadFilters.search.toLowerCase();
-      filtered = filtered.filter(l => 
-        l.nome.toLowerCase().includes(search) ||
-        (l.email || '').toLowerCase().includes(search) ||
-        l.empresa.toLowerCase().includes(search) ||
-        l.telefone.includes(search) ||
-        l.cidade.toLowerCase().includes(search)
-      );
-    }
-    
-    setFilteredLeads(filtered);
+    setFilteredLeads(leads.filter(l => matchesLeadFilters(l, leadFilters)));
   };
 
   const handleLogout = () => {
@@ -162,6 +275,8 @@ const AdminDashboard = () => {
     try {
       await leadsApi.updateStatus(leadId, status);
       setLeads(leads.map(l => l.id === leadId ? { ...l, status } : l));
+      const statsRes = await leadsApi.stats();
+      setLeadStats(statsRes.data);
       toast.success('Status atualizado');
     } catch (error) {
       toast.error('Erro ao atualizar status');
@@ -171,8 +286,7 @@ const AdminDashboard = () => {
   const handleExportCSV = async () => {
     try {
       const response = await leadsApi.exportCsv();
-      const blob = new Blob([response.data.csv], { type: 'text/csv' });
-      const url = window.URL.createObjectURL(blob);
+      const url = window.URL.createObjectURL(response.data);
       const a = document.createElement('a');
       a.href = url;
       a.download = `leads-alluz-${new Date().toISOString().split('T')[0]}.csv`;
@@ -183,20 +297,28 @@ const AdminDashboard = () => {
     }
   };
 
-  const getFileUrl = (lead, key) => {
-    const fileType = lead[`${key}_arquivo_tipo`];
-    const fileBase64 = lead[`${key}_arquivo_base64`];
-    if (!fileType || !fileBase64) return null;
-    return `data:${fileType};base64,${fileBase64}`;
+  const getFileUrl = async (lead, key) => {
+    if (!lead[`${key}_arquivo_nome`]) return null;
+    try {
+      const response = await leadsApi.getFile(lead.id, key);
+      // blob: URLs run in the dashboard's origin, so never trust the served type
+      const type = PREVIEWABLE_FILE_TYPES.includes(response.data.type) ? response.data.type : 'application/octet-stream';
+      return window.URL.createObjectURL(new Blob([response.data], { type }));
+    } catch (error) {
+      return null;
+    }
   };
 
-  const handleOpenFilePreview = (lead, key, title) => {
-    const fileUrl = getFileUrl(lead, key);
+  const handleOpenFilePreview = async (lead, key, title) => {
+    const fileUrl = await getFileUrl(lead, key);
     if (!fileUrl) {
       toast.error('Arquivo não encontrado para este lead');
       return;
     }
 
+    if (filePreview.fileUrl) {
+      window.URL.revokeObjectURL(filePreview.fileUrl);
+    }
     setFilePreview({
       open: true,
       title,
@@ -206,8 +328,8 @@ const AdminDashboard = () => {
     });
   };
 
-  const handleOpenMonitoringPrint = (lead) => {
-    const fileUrl = getFileUrl(lead, 'monitoramento');
+  const handleOpenMonitoringPrint = async (lead) => {
+    const fileUrl = await getFileUrl(lead, 'monitoramento');
     if (!fileUrl) {
       toast.error('Print do monitoramento não encontrado');
       return;
@@ -442,7 +564,7 @@ const AdminDashboard = () => {
               <div className="flex items-center justify-between">
                 <div>
                   <p className="text-sm text-gray-500">Total de Leads</p>
-                  <p className="text-3xl font-bold text-gray-900">{leads.length}</p>
+                  <p className="text-3xl font-bold text-gray-900">{leadStats ? leadStats.total : leads.length}</p>
                 </div>
                 <div className="w-12 h-12 bg-amber-100 rounded-xl flex items-center justify-center">
                   <Users className="w-6 h-6 text-amber-600" />
@@ -455,7 +577,7 @@ const AdminDashboard = () => {
               <div className="flex items-center justify-between">
                 <div>
                   <p className="text-sm text-gray-500">Novos</p>
-                  <p className="text-3xl font-bold text-blue-600">{leads.filter(l => l.status === 'novo').length}</p>
+                  <p className="text-3xl font-bold text-blue-600">{leadStats ? leadStats.status.novo || 0 : leads.filter(l => l.status === 'novo').length}</p>
                 </div>
                 <div className="w-12 h-12 bg-blue-100 rounded-xl flex items-center justify-center">
                   <Users className="w-6 h-6 text-blue-600" />
@@ -468,7 +590,7 @@ const AdminDashboard = () => {
               <div className="flex items-center justify-between">
                 <div>
                   <p className="text-sm text-gray-500">Fechados</p>
-                  <p className="text-3xl font-bold text-green-600">{leads.filter(l => l.status === 'fechado').length}</p>
+                  <p className="text-3xl font-bold text-green-600">{leadStats ? leadStats.status.fechado || 0 : leads.filter(l => l.status === 'fechado').length}</p>
                 </div>
                 <div className="w-12 h-12 bg-green-100 rounded-xl flex items-center justify-center">
                   <Check className="w-6 h-6 text-green-600" />
@@ -551,9 +673,9 @@ const AdminDashboard = () => {
                   <div className="relative">
                     <Search className="absolute left-3 top-1/2 -translate-y-1/2 w-4 h-4 text-gray-400" />
                     <Input
-                      placeholder="Buscar..."
-                      value={leadFilters.search}
-                      onChange={(e) => setLeadFilters(prev => ({ ...prev, search: e.target.value }))}
+                      placeholder="Buscar por nome, empresa, email ou telefone..."
+                      value={leadSearchInput}
+                      onChange={(e) => setLeadSearchInput(e.target.value)}
                       className="pl-10"
                       data-testid="search-leads-input"
                     />
@@ -684,6 +806,18 @@ const AdminDashboard = () => {
                     </TableBody>
                   </Table>
                 </div>
+                {leadsCursor && (
+                  <div className="flex justify-center pt-4">
+                    <Button
+                      variant="outline"
+                      onClick={loadMoreLeads}
+                      disabled={loadingMoreLeads}
+                      data-testid="load-more-leads-btn"
+                    >
+                      {loadingMoreLeads ? 'Carregando...' : 'Carregar mais leads'}
+                    </Button>
+                  </div>
+                )}
               </CardContent>
             </Card>
           </TabsContent>
@@ -710,6 +844,7 @@ const AdminDashboard = () => {
                   <iframe
                     title={filePreview.title}
                     src={filePreview.fileUrl}
+                    sandbox=""
                     className="w-full h-[70vh] rounded-md border"
                   />
                 )}
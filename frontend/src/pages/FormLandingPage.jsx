@@ -91,6 +91,8 @@ const FormLandingPage = () => {
     } catch (error) {
       if (error.response?.status === 429) {
         toast.error('Muitas tentativas. Aguarde 1 minuto e tente novamente.');
+      } else if ([413, 415, 503].includes(error.response?.status)) {
+        toast.error(error.response.data?.detail || 'Não foi possível enviar agora. Tente novamente.');
       } else {
         toast.error('Não foi possível enviar agora. Tente novamente.');
       }
@@ -163,7 +165,7 @@ const FormLandingPage = () => {
                     id="contaLuzArquivo"
                     name="contaLuzArquivo"
                     type="file"
-                    accept="image/*,application/pdf"
+                    accept="application/pdf,image/png,image/jpeg,image/webp"
                     onChange={handleFileChange}
                   />
                 </div>
@@ -176,7 +178,7 @@ const FormLandingPage = () => {
                     id="monitoramentoArquivo"
                     name="monitoramentoArquivo"
                     type="file"
-                    accept="image/*,application/pdf"
+                    accept="application/pdf,image/png,image/jpeg,image/webp"
                     onChange={handleFileChange}
                   />
                 </div>
@@ -8,7 +8,7 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@
 import { Textarea } from '@/components/ui/textarea';
 import { Accordion, AccordionContent, AccordionItem, AccordionTrigger } from '@/components/ui/accordion';
 import { toast } from 'sonner';
-import { contentApi, plansApi, leadsApi } from '@/lib/api';
+import { siteApi, leadsApi } from '@/lib/api';
 
 const LandingPage = () => {
   const [content, setContent] = useState({});
@@ -38,12 +38,9 @@ const LandingPage = () => {
 
   const loadData = async () => {
     try {
-      const [contentRes, plansRes] = await Promise.all([
-        contentApi.getAll(),
-        plansApi.getAll()
-      ]);
-      setContent(contentRes.data);
-      setPlans(plansRes.data);
+      const response = await siteApi.bootstrap();
+      setContent(response.data.content);
+      setPlans(response.data.plans);
     } catch (error) {
       console.error('Error loading data:', error);
     } finally {
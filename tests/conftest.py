@@ -0,0 +1,34 @@
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# server.py is a top-level module in backend/, imported the way uvicorn does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture
+def run_with_db():
+    # Tests that need MongoDB get a throwaway database on TEST_MONGO_URL. The
+    # client is created inside the test's own event loop, which Motor requires.
+    url = os.environ.get("TEST_MONGO_URL")
+    if not url:
+        pytest.skip("TEST_MONGO_URL is not set")
+
+    def run(scenario):
+        async def main():
+            client = AsyncIOMotorClient(url, serverSelectionTimeoutMS=2000)
+            db = client[f"alluz_test_{uuid.uuid4().hex[:12]}"]
+            try:
+                return await scenario(db)
+            finally:
+                await client.drop_database(db.name)
+                client.close()
+
+        return asyncio.run(main())
+
+    return run
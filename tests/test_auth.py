@@ -0,0 +1,50 @@
+import asyncio
+
+from passlib.context import CryptContext
+
+import server
+
+
+def bcrypt_context(rounds):
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_desired_rounds=rounds,
+        bcrypt__max_desired_rounds=rounds,
+    )
+
+
+def test_hasher_rejects_beyond_max_pending():
+    hasher = server.PasswordHasher(bcrypt_context(4), 1, 1)
+
+    async def run():
+        first = asyncio.ensure_future(hasher.hash("senha"))
+        await asyncio.sleep(0)
+        try:
+            await hasher.hash("outra")
+        except server.HTTPException as exc:
+            return exc, await first
+        raise AssertionError("second hash was admitted")
+
+    exc, _ = asyncio.run(run())
+    assert exc.status_code == 503
+    assert exc.headers["Retry-After"] == "1"
+    assert hasher.rejected == 1 and hasher.pending == 0
+
+
+def test_login_rehashes_when_rounds_change(monkeypatch, run_with_db):
+    old_hash = bcrypt_context(5).hash("admin123")
+    monkeypatch.setattr(server, "password_hasher", server.PasswordHasher(bcrypt_context(4), 1, 4))
+
+    async def scenario(db):
+        monkeypatch.setattr(server, "mongo_db", db)
+        await db.admins.insert_one({"username": "admin", "password_hash": old_hash, "token_version": 0})
+        token = await server.login(server.AdminLogin(username="admin", password="admin123"))
+        return token, await db.admins.find_one({"username": "admin"})
+
+    token, admin = run_with_db(scenario)
+    assert token["access_token"]
+    assert old_hash.startswith("$2b$05$")
+    assert admin["password_hash"].startswith("$2b$04$")
+    assert bcrypt_context(4).verify("admin123", admin["password_hash"])
@@ -0,0 +1,89 @@
+import asyncio
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import server
+
+
+def test_failed_document_fails_only_its_own_insert():
+    batches = []
+
+    async def write(db, documents):
+        batches.append(list(documents))
+        error = {"index": 1, "code": 11000, "errmsg": "E11000 duplicate key"}
+        return server.bulk_write_failures(BulkWriteError({"writeErrors": [error], "writeConcernErrors": []}), len(documents))
+
+    batcher = server.InsertBatcher(60, 3, write)
+
+    async def run():
+        return await asyncio.gather(*(batcher.insert(None, {"id": str(i)}) for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert len(batches) == 1 and len(batches[0]) == 3
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], DuplicateKeyError)
+
+
+def test_write_concern_error_fails_the_whole_batch():
+    exc = BulkWriteError({"writeErrors": [], "writeConcernErrors": [{"code": 64, "errmsg": "waiting for replication timed out"}]})
+    failures = server.bulk_write_failures(exc, 3)
+    assert sorted(failures) == [0, 1, 2]
+    assert all(failure is exc for failure in failures.values())
+
+
+def test_drain_flushes_pending_inserts():
+    written = []
+
+    async def write(db, documents):
+        written.extend(documents)
+        return {}
+
+    # A window long enough that only drain() can flush it
+    batcher = server.InsertBatcher(60, 100, write)
+
+    async def run():
+        inserts = [asyncio.create_task(batcher.insert(None, {"id": str(i)})) for i in range(2)]
+        await asyncio.sleep(0)
+        assert not written and len(batcher.pending) == 2
+        await batcher.drain()
+        return await asyncio.gather(*inserts)
+
+    assert asyncio.run(run()) == [None, None]
+    assert [document["id"] for document in written] == ["0", "1"]
+    assert batcher.pending == [] and batcher.timer is None
+
+
+def test_flushes_when_the_window_closes():
+    written = []
+
+    async def write(db, documents):
+        written.append(len(documents))
+        return {}
+
+    batcher = server.InsertBatcher(0.01, 100, write)
+
+    async def run():
+        await asyncio.gather(batcher.insert(None, {"id": "a"}), batcher.insert(None, {"id": "b"}))
+
+    asyncio.run(run())
+    assert written == [2]
+
+
+def test_duplicate_lead_in_batch_fails_alone(monkeypatch, run_with_db):
+    monkeypatch.setattr(server, "outbox_sinks", [])
+
+    async def scenario(db):
+        await db.leads.create_index([("id", ASCENDING)], unique=True)
+        await db.leads.insert_one({"id": "taken"})
+        batcher = server.InsertBatcher(60, 3, server.write_leads)
+        results = await asyncio.gather(
+            *(batcher.insert(db, {"id": lead_id}) for lead_id in ("new-1", "taken", "new-2")),
+            return_exceptions=True,
+        )
+        return results, sorted([row["id"] async for row in db.leads.find({}, {"_id": 0, "id": 1})])
+
+    results, stored = run_with_db(scenario)
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], DuplicateKeyError)
+    assert stored == ["new-1", "new-2", "taken"]
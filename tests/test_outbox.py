@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+
+import server
+
+
+class RecordingSink(server.OutboxSink):
+    def __init__(self, error=None):
+        self.error = error
+        self.delivered = []
+
+    async def deliver(self, entries):
+        self.delivered.extend(entry["_id"] for entry in entries)
+        if self.error:
+            return {entry["_id"]: self.error for entry in entries}
+        return {}
+
+
+def pending_entry(sink, attempts=0):
+    now = datetime.now(timezone.utc)
+    return {
+        "sink": sink,
+        "event": "lead.created",
+        "lead_id": "lead-1",
+        "payload": {},
+        "status": "pending",
+        "attempts": attempts,
+        "available_at": now - timedelta(seconds=1),
+        "created_at": now,
+    }
+
+
+def test_expired_lease_is_claimed_again(monkeypatch, run_with_db):
+    sink = RecordingSink()
+    monkeypatch.setattr(server, "outbox_sinks", {"webhook": sink})
+    worker = server.OutboxWorker(10, 60)
+
+    async def scenario(db):
+        await db.outbox.insert_one(pending_entry("webhook"))
+        first = await worker.claim(db)
+        # The lease is still held, so nobody else gets the entry
+        while_leased = await worker.claim(db)
+        # The holder crashed; once the lease runs out the entry is due again
+        await db.outbox.update_one(
+            {"_id": first[0]["_id"]}, {"$set": {"available_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+        second = await worker.claim(db)
+        # A late settle from the crashed holder must not touch the new lease
+        await worker.deliver(db, "webhook", first)
+        after_stale = await db.outbox.find_one({"_id": first[0]["_id"]})
+        await worker.deliver(db, "webhook", second)
+        return first, while_leased, second, after_stale, await db.outbox.find_one({"_id": first[0]["_id"]})
+
+    first, while_leased, second, after_stale, settled = run_with_db(scenario)
+    assert len(first) == 1 and first[0]["attempts"] == 1
+    assert while_leased == []
+    assert len(second) == 1 and second[0]["attempts"] == 2
+    assert second[0]["lease"] != first[0]["lease"]
+    assert after_stale["status"] == "pending" and after_stale["lease"] == second[0]["lease"]
+    assert settled["status"] == "delivered" and "lease" not in settled
+
+
+def test_failed_delivery_backs_off_then_parks(monkeypatch, run_with_db):
+    monkeypatch.setattr(server, "outbox_sinks", {"email": RecordingSink("smtp down")})
+    worker = server.OutboxWorker(10, 60)
+
+    async def scenario(db):
+        retry = await db.outbox.insert_one(pending_entry("email"))
+        last = await db.outbox.insert_one(pending_entry("email", attempts=server.OUTBOX_MAX_ATTEMPTS - 1))
+        claimed = await worker.run_once(db)
+        return (
+            claimed,
+            await db.outbox.find_one({"_id": retry.inserted_id}),
+            await db.outbox.find_one({"_id": last.inserted_id}),
+        )
+
+    claimed, retry, parked = run_with_db(scenario)
+    assert claimed == 2
+    assert retry["status"] == "pending" and retry["attempts"] == 1
+    assert retry["available_at"].replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+    assert retry["last_error"] == "smtp down" and "lease" not in retry
+    assert parked["status"] == "failed" and parked["attempts"] == server.OUTBOX_MAX_ATTEMPTS
+    assert parked["last_error"] == "smtp down" and "lease" not in parked
+
+
+def test_lead_insert_writes_one_entry_per_sink(monkeypatch, run_with_db):
+    monkeypatch.setattr(server, "outbox_sinks", {"email": RecordingSink(), "webhook": RecordingSink()})
+
+    async def scenario(db):
+        failures = await server.write_leads(db, [{"id": "lead-1", "nome": "Ana"}, {"id": "lead-2", "nome": "Bia"}])
+        entries = [row async for row in db.outbox.find({}, {"_id": 0, "sink": 1, "lead_id": 1, "status": 1})]
+        return failures, entries
+
+    failures, entries = run_with_db(scenario)
+    assert failures == {}
+    assert sorted((entry["lead_id"], entry["sink"]) for entry in entries) == [
+        ("lead-1", "email"), ("lead-1", "webhook"), ("lead-2", "email"), ("lead-2", "webhook"),
+    ]
+    assert {entry["status"] for entry in entries} == {"pending"}
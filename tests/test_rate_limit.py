@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import server
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [120.0]
+    monkeypatch.setattr(server.time, "time", lambda: now[0])
+    return now
+
+
+def hits(limiter, key, count):
+    async def run():
+        return [await limiter.hit(key) for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def make_request(forwarded=None, peer="10.0.0.1"):
+    headers = [(b"x-forwarded-for", forwarded.encode("ascii"))] if forwarded is not None else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 40000)})
+
+
+def test_memory_limiter_rejects_after_limit(clock):
+    limiter = server.MemoryRateLimiter(5, 60, 100)
+    assert hits(limiter, "1.2.3.4", 6) == [True] * 5 + [False]
+    # Other keys have their own budget
+    assert hits(limiter, "5.6.7.8", 1) == [True]
+
+
+def test_memory_limiter_slides_into_next_window(clock):
+    limiter = server.MemoryRateLimiter(5, 60, 100)
+    assert all(hits(limiter, "ip", 5))
+    # At the start of the next window the previous one still counts in full
+    clock[0] = 180.0
+    assert hits(limiter, "ip", 1) == [False]
+    # Halfway through, it weighs 2.5 hits
+    clock[0] = 210.0
+    assert hits(limiter, "ip", 4) == [True, True, True, False]
+    # Two windows later nothing carries over
+    clock[0] = 300.0
+    assert hits(limiter, "ip", 6) == [True] * 5 + [False]
+
+
+def test_memory_limiter_evicts_least_recent_keys(clock):
+    limiter = server.MemoryRateLimiter(5, 60, 2)
+    hits(limiter, "a", 1)
+    hits(limiter, "b", 1)
+    hits(limiter, "c", 1)
+    assert list(limiter.buckets) == ["b", "c"]
+
+
+def test_client_ip_ignores_forwarded_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_HOPS", 0)
+    assert server.get_client_ip(make_request("6.6.6.6")) == "10.0.0.1"
+
+
+def test_client_ip_skips_client_supplied_forwarded_entries(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_HOPS", 1)
+    # The proxy appends the address it saw; anything left of it came from the client
+    assert server.get_client_ip(make_request("203.0.113.7")) == "203.0.113.7"
+    assert server.get_client_ip(make_request("6.6.6.6, 203.0.113.7")) == "203.0.113.7"
+    assert server.get_client_ip(make_request("1.1.1.1, 2.2.2.2, 203.0.113.7")) == "203.0.113.7"
+    assert server.get_client_ip(make_request()) == "10.0.0.1"
+
+
+def test_client_ip_with_two_proxy_hops(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_HOPS", 2)
+    assert server.get_client_ip(make_request("6.6.6.6, 203.0.113.7, 10.1.1.1")) == "203.0.113.7"
+
+
+def test_lead_submissions_get_429_with_spoofed_forwarded_prefixes(monkeypatch, clock):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_HOPS", 1)
+    monkeypatch.setattr(server, "rate_limiter", server.MemoryRateLimiter(5, 60, 100))
+    client = TestClient(server.app)
+    statuses = []
+    for attempt in range(6):
+        # A new made-up prefix on every request must not buy a new budget.
+        # The honeypot answers 400 once admitted, before the database is needed.
+        response = client.post(
+            "/api/leads",
+            json={"nome": "x", "empresa": "x", "telefone": "x", "cidade": "x", "plano": "x", "honeypot": "x"},
+            headers={"X-Forwarded-For": f"198.51.100.{attempt}, 203.0.113.7"},
+        )
+        statuses.append(response.status_code)
+    assert statuses == [400] * 5 + [429]